@@ -0,0 +1,96 @@
+# Index of an uncompressed UniProt xml file: the byte offset and length of every entry, by
+# each of its accession numbers (the primary one and the secondary ones). It is built once
+# by scanning the raw bytes, without parsing the xml, and lets graphmaker and xmlprinter
+# read just the entries they are asked for.
+#
+#   python accessionindex.py uniprot_sprot.xml uniprot_sprot.xml.idx
+
+import argparse
+import os
+import re
+import sqlite3
+from entryscan import scan_entries
+
+# The accession numbers of an entry, in its raw bytes
+accession_pattern = re.compile(rb'<accession>([^<]*)</accession>')
+
+
+class AccessionIndex:
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS accessions (
+                   accession TEXT PRIMARY KEY,
+                   offset INTEGER,
+                   length INTEGER
+               ) WITHOUT ROWID""")
+        # The file the index was built from, to notice when it's used with another one
+        self.connection.execute("CREATE TABLE IF NOT EXISTS indexed (filename TEXT, size INTEGER)")
+
+    def close(self):
+        self.connection.close()
+
+    def build(self, filename, batch_size=100000):
+        """Index every entry of the file, replacing what was in the index. Returns the number
+        of entries. An accession that is secondary in more than one entry keeps the first."""
+        entries = 0
+        rows = []
+        with self.connection:
+            self.connection.execute("DELETE FROM accessions")
+            self.connection.execute("DELETE FROM indexed")
+            for offset, length, data in scan_entries(filename):
+                entries += 1
+                rows.extend((accession.decode(), offset, length)
+                            for accession in accession_pattern.findall(data))
+                if len(rows) >= batch_size:
+                    self._insert(rows)
+                    rows = []
+            self._insert(rows)
+            self.connection.execute("INSERT INTO indexed VALUES (?, ?)",
+                                    (os.path.abspath(filename), os.path.getsize(filename)))
+        return entries
+
+    def _insert(self, rows):
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO accessions (accession, offset, length) VALUES (?, ?, ?)", rows)
+
+    def check(self, filename):
+        """Raises ValueError unless the index was built from this file, as it is now"""
+        row = self.connection.execute("SELECT filename, size FROM indexed").fetchone()
+        if row is None:
+            raise ValueError("The index is empty, build it first")
+        if (row[0], row[1]) != (os.path.abspath(filename), os.path.getsize(filename)):
+            raise ValueError("The index was built from {f} of {s} bytes, not from this file".format(
+                f=row[0], s=row[1]))
+
+    def lookup(self, accessions):
+        """The (offset, length) of the entries with these accessions, in the order of the file
+        and every entry once, and the accessions that aren't in the index"""
+        ranges = set()
+        missing = []
+        for accession in accessions:
+            row = self.connection.execute(
+                "SELECT offset, length FROM accessions WHERE accession = ?", (accession,)).fetchone()
+            if row is None:
+                missing.append(accession)
+            else:
+                ranges.add(row)
+        return sorted(ranges), missing
+
+
+def read_accessions(path):
+    """The accessions in a text file, one per line"""
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the entries of a UniProt xml file by accession")
+    parser.add_argument('filename', help="uncompressed UniProt xml file")
+    parser.add_argument('index', nargs='?', help="sqlite file of the index, by default filename.idx")
+    args = parser.parse_args()
+
+    index = AccessionIndex(args.index or args.filename + '.idx')
+    print("Indexed {n} entries".format(n=index.build(args.filename)))
+    index.close()
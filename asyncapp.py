@@ -0,0 +1,206 @@
+# Asynchronous version of App, built on the async Neo4j driver. Its load() runs the
+# parsing in a thread that fills a bounded queue of batches, while several sessions
+# write batches from the queue concurrently, so extraction overlaps with the commits.
+# The queries are the batched ones from neo4japp.
+
+import asyncio
+import logging
+import threading
+import time
+from types import SimpleNamespace
+from neo4j import AsyncGraphDatabase
+from neo4j.exceptions import ServiceUnavailable
+from metrics import param_bytes
+from neo4japp import App, BATCH_QUERIES, DELETE_QUERIES, RETRY_ERRORS, backoff_delays
+
+# The section of BATCH_QUERIES every create_* method writes, and the key of its rows
+SECTION_KEYS = {section: key for section, key, query in BATCH_QUERIES}
+
+
+class AsyncApp:
+
+    def __init__(self, uri, user, password, quiet=False, metrics=None, retries=0, backoff=1.0,
+                 cache=None):
+        self.driver = AsyncGraphDatabase.driver(uri, auth=(user, password))
+        self.quiet = quiet
+        self.counters = {}
+        self.metrics = metrics
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+
+    async def close(self):
+        await self.driver.close()
+
+    # The counters and the cache are kept the same way as in App
+    count = App.count
+    report = App.report
+    remember = App.remember
+
+    async def load(self, entries, batch_size=500, concurrency=4, queue_size=8,
+                   replace=False, committed=None):
+        """Write extracted entries in batches of batch_size, like App.load, with concurrency
+        sessions writing at the same time. entries is consumed in a separate thread, and at
+        most queue_size batches wait to be written before that thread has to wait as well.
+
+        Batches are committed in no particular order, so committed may be called out of order.
+        Concurrent MERGEs on the same gene, author etc. can deadlock, the driver retries those.
+        Two MERGEs that create the same node at the same time both succeed unless a uniqueness
+        constraint makes one of them wait, so this relies on the constraints of ensure_schema;
+        graphmaker won't load with concurrency when check_schema reports any missing."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=queue_size)
+        stop = threading.Event()
+
+        async def put_or_stop(item):
+            # Wait for room in short steps, so the producer gives up once the writers stopped
+            while not stop.is_set():
+                try:
+                    return await asyncio.wait_for(queue.put(item), 0.1)
+                except asyncio.TimeoutError:
+                    pass
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(put_or_stop(item), loop).result()
+
+        def produce():
+            try:
+                batch = []
+                for entry in entries:
+                    if stop.is_set():
+                        return
+                    batch.append(entry)
+                    if len(batch) >= batch_size:
+                        put(batch)
+                        batch = []
+                if batch:
+                    put(batch)
+            finally:
+                # One None for every writer to tell it to stop
+                for _ in range(concurrency):
+                    put(None)
+
+        async def write():
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                await self.write_batch(batch, replace)
+                if committed:
+                    committed(batch)
+
+        producer = loop.run_in_executor(None, produce)
+        writers = [asyncio.ensure_future(write()) for _ in range(concurrency)]
+        try:
+            await asyncio.wait(writers, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # After a failed batch (or when load is cancelled) the producer and the other
+            # writers are stopped as well, and waited for, so none of them is left running
+            # once load returns and the driver may be closed
+            stop.set()
+            for writer in writers:
+                writer.cancel()
+            results = await asyncio.gather(producer, *writers, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def write_batch(self, entries, replace=False):
+        """create_entries, retried after errors in RETRY_ERRORS like App.write_batch"""
+        for delay in backoff_delays(self.retries, self.backoff):
+            try:
+                return await self.create_entries(entries, replace)
+            except RETRY_ERRORS as exception:
+                logging.warning("Writing a batch of {n} entries failed, retrying in {d:g}s: "
+                                "{exception}".format(n=len(entries), d=delay, exception=exception))
+                await asyncio.sleep(delay)
+                replace = True
+        return await self.create_entries(entries, replace)
+
+    async def create_entries(self, entries, replace=False, sections=None):
+        """Write a batch of extracted entries in a single transaction, see App.create_entries"""
+        async with self.driver.session(database="neo4j") as session:
+            start = time.perf_counter()
+            result = await session.execute_write(
+                self._create_entries, entries, replace, sections, self.metrics, self.cache)
+            self.remember(entries, sections)
+            if self.metrics:
+                self.metrics.record('transaction batch', time.perf_counter() - start,
+                                    rows=len(entries), nbytes=param_bytes(entries))
+            for section, counters in result:
+                self.count(section, counters)
+            if not self.quiet:
+                print("Loaded batch of {n} entries".format(n=len(entries)))
+
+    @staticmethod
+    async def _create_entries(tx, entries, replace=False, sections=None, metrics=None, cache=None):
+        result = []
+        if replace:
+            for query in DELETE_QUERIES:
+                summary = await (await tx.run(
+                    query, protein_ids=[entry.protein_id for entry in entries])).consume()
+                result.append(('delete', summary.counters))
+        for section, query, params in App._batch_statements(entries, sections, cache):
+            try:
+                start = time.perf_counter()
+                summary = await (await tx.run(query, entries=params)).consume()
+                result.append((section, summary.counters))
+                if metrics:
+                    metrics.record('write ' + section, time.perf_counter() - start,
+                                   rows=App._row_count(params), nbytes=param_bytes(params))
+            # Capture any errors along with the query and data for traceability
+            except ServiceUnavailable as exception:
+                logging.error("{query} raised an error: \n {exception}".format(
+                    query=query, exception=exception))
+                raise
+        return result
+
+    async def _create_section(self, section, protein_id, rows):
+        """Write a single section of a single protein"""
+        entry = SimpleNamespace(protein_id=protein_id)
+        if SECTION_KEYS[section]:
+            setattr(entry, SECTION_KEYS[section], rows)
+        async with self.driver.session(database="neo4j") as session:
+            result = await session.execute_write(
+                self._create_entries, [entry], False, [section], self.metrics, self.cache)
+            self.remember([entry], [section])
+            for section, counters in result:
+                self.count(section, counters)
+            if not self.quiet:
+                print("Wrote {section} of protein {pr}".format(section=section, pr=protein_id))
+
+    # The create_* methods take the same arguments as in App
+
+    async def create_protein(self, protein_id):
+        await self._create_section('protein', protein_id, None)
+
+    async def create_proteinnames(self, protein_id, protein_name_list):
+        await self._create_section('names', protein_id, protein_name_list)
+
+    async def create_gene(self, protein_id, gene_list):
+        await self._create_section('gene', protein_id, gene_list)
+
+    async def create_organism(self, protein_id, organism_dict):
+        await self._create_section('organism', protein_id, organism_dict)
+
+    async def create_references(self, protein_id, reference_list):
+        await self._create_section('references', protein_id, reference_list)
+
+    async def create_authors(self, protein_id, author_list):
+        await self._create_section('authors', protein_id, author_list)
+
+    async def create_dbreferences(self, protein_id, dbref_list):
+        await self._create_section('dbreferences', protein_id, dbref_list)
+
+    async def create_keywords(self, protein_id, keyword_list):
+        await self._create_section('keywords', protein_id, keyword_list)
+
+    async def create_features(self, protein_id, feature_list):
+        await self._create_section('features', protein_id, feature_list)
+
+    async def create_evidence(self, protein_id, evidence_list, evidence_link_list):
+        await self._create_section('evidence', protein_id, evidence_list)
+        await self._create_section('evidence links', protein_id, evidence_link_list)
+
+    async def create_sequence(self, protein_id, sequence_dict):
+        await self._create_section('sequence', protein_id, sequence_dict)
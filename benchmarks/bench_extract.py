@@ -0,0 +1,203 @@
+# Compare the time per entry of the single-pass EntryExtractor with the previous extractor,
+# which called find/findall on the entry for every section. Both get the same parsed
+# entries, so only the extraction itself is timed. The walk over the entry (EntryExtractor.walk)
+# is compared like for like; resolving the evidence of names, features and references is
+# timed on top of it, as the old extractor left that to the database.
+#
+#   python benchmarks/bench_extract.py Q9Y261.xml --repeat 200
+
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from graphmaker import extract_entry, extractor, uniprot
+
+
+def extract_entry_findall(entry, uniprot=uniprot):
+    """The extractor as it was before EntryExtractor, kept as the baseline"""
+
+    # Extract the first accession number as the protein_id
+    protein_id = entry.find(uniprot+'accession').text
+
+    # Get all names for the protein and create the names for the relationships
+    proteins = entry.find(uniprot+'protein')
+    protein_name_list = []
+    for child in proteins:
+        for branch in child:
+            proteindata = {'recalt' : child.tag[28:], 'name': branch.text}
+            proteindata['has'] = "HAS_"+branch.tag[28:-4].upper()+'_'+'NAME'  # relationship name
+            protein_name_list.append(proteindata)
+
+    # If we only want the recommended names, use:
+
+    # recprotein = entry.find(uniprot+'protein').find(uniprot+'recommendedName')
+    # protein_name_list = []
+    # for child in recprotein:
+    #     proteindata = {'name' : child.text}
+    #     proteindata['has'] = "HAS_"+child.tag[28:-4].upper()+'_'+'NAME'  # relationship name
+    #     protein_name_list.append(proteindata)
+
+    # Extract gene data from the entry. Not every entry in a full dump has a gene.
+    gene_list = []
+    for genes in entry.findall(uniprot+'gene'):
+        for gene in genes:
+            genedata = {'name' : gene.text, 'type': gene.attrib['type']}
+            gene_list.append(genedata)
+
+    # Extract organism with its scientific, common and reference id
+    organism = entry.find(uniprot+'organism')
+    organism_dict = {}
+    for name in organism.findall(uniprot+'name'):
+        organism_dict[name.attrib['type']+'Name'] =  name.text
+    ref = organism.find(uniprot+'dbReference')
+    organism_dict['id'] = ref.attrib['id']
+
+    # Extract references
+    # We make a separate list of authors that will be linked to the references through the key
+    references = entry.findall(uniprot+'reference')
+    reference_list = []
+    author_list = []
+    for ref in references:
+        refdata = {}
+        refdata['key'] = ref.attrib['key']
+        citation = ref.find(uniprot+'citation')
+        refdata.update(citation.attrib)
+        title = citation.find(uniprot+'title')
+        if title is not None:
+            refdata['title'] = title.text
+        reference_list.append(refdata)
+        authorlist = citation.find(uniprot+'authorList')
+        if authorlist is not None:
+            for author in authorlist:
+                authors = {'name': author.attrib['name'], 'ref_key' : ref.attrib['key']}
+                author_list.append(authors)
+        dbref = citation.findall(uniprot+'dbReference')
+        for db in dbref:
+            refdata[db.attrib['type']] = db.attrib['id']
+        scope = ref.find(uniprot+'scope')
+        if scope is not None:
+            refdata['scope'] = scope.text
+
+    # Extract features. For missing values, we enter 'N/A'
+    features = entry.findall(uniprot+'feature')
+    feature_list = []
+    for feature in features:
+        featdata = {'type' : feature.attrib['type']}
+        if 'description' in feature.attrib:
+            featdata['name'] = feature.attrib['description']
+        else:
+            featdata['name'] = 'N/A'
+        if 'evidence' in feature.attrib:
+            featdata['evidence'] = feature.attrib['evidence']
+        else:
+            featdata['evidence'] = 'N/A'
+        # Variants have <original> and <variation> before the location
+        for pos in feature.find(uniprot+'location'):
+            featdata[pos.tag[28:]] = pos.attrib.get('position')
+        feature_list.append(featdata)
+
+    # Extract evidence, enter 'N/A' for missing source type and source data
+    evidences = entry.findall(uniprot+'evidence')
+    evidence_list =[]
+    for evidence in evidences:
+        evidata = {'type': evidence.attrib['type'], 'key': evidence.attrib['key']}
+        if len(evidence)>0:
+            for source in evidence[0]:
+                evidata['sourcetype'] = source.attrib['type']
+                evidata['sourceid'] = source.attrib['id']
+        else:
+            evidata['sourcetype'] = 'N/A'
+            evidata['sourceid'] = 'N/A'
+        evidence_list.append(evidata)
+
+    # Extract dbReferences and their properties
+    dbReferences = entry.findall(uniprot+'dbReference')
+    dbref_list = []
+    for dbref in dbReferences:
+        dbdata = dbref.attrib
+        if len(dbref) > 0:
+            for prop in dbref:
+                if prop.tag[28:] == 'property':
+                    dbdata[prop.attrib['type']] = prop.attrib['value']
+                else: dbdata[prop.tag[28:]+'_id'] = prop.attrib['id']
+        dbref_list.append(dbdata)
+
+    # Extract keywords
+    keywords = entry.findall(uniprot+'keyword')
+    keyword_list = []
+    for keyword in keywords:
+        keydata = {'id' : keyword.attrib['id'], 'keyword' : keyword.text}
+        keyword_list.append(keydata)
+
+    # Extract the sequence of the protein
+    sequence = entry.find(uniprot+'sequence')
+    sequence_dict = sequence.attrib
+    sequence_dict['sequence'] = sequence.text
+
+    return {'protein_id': protein_id,
+            'version': entry.attrib.get('version'),
+            'modified': entry.attrib.get('modified'),
+            'protein_name_list': protein_name_list,
+            'gene_list': gene_list,
+            'organism_dict': organism_dict,
+            'reference_list': reference_list,
+            'author_list': author_list,
+            'dbref_list': dbref_list,
+            'keyword_list': keyword_list,
+            'feature_list': feature_list,
+            'evidence_list': evidence_list,
+            'sequence_dict': sequence_dict}
+
+
+def timed(extract, elements, repeat):
+    """Seconds per entry of one round"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for element in elements:
+            extract(element)
+    return (time.perf_counter() - start) / (repeat * len(elements))
+
+
+def speed(ratio):
+    """A ratio of times as how much faster or slower"""
+    if ratio >= 1:
+        return "{x:.2f}x faster".format(x=ratio)
+    return "{x:.2f}x slower".format(x=1 / ratio)
+
+
+def compare(extractors, repeat, rounds=15):
+    """The best time per entry of every (extract, elements), and the median of the ratios of
+    the first one to the others per round. The rounds of the extractors take turns, so noise
+    from other processes hits both alike."""
+    best = [None] * len(extractors)
+    ratios = [[] for _ in extractors]
+    for _ in range(rounds):
+        seconds = [timed(extract, elements, repeat) for extract, elements in extractors]
+        for i, s in enumerate(seconds):
+            best[i] = s if best[i] is None else min(best[i], s)
+            ratios[i].append(seconds[0] / s)
+    return best, [sorted(r)[len(r) // 2] for r in ratios]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the time per entry of both extractors")
+    parser.add_argument('filename')
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=15)
+    args = parser.parse_args()
+
+    # The old extractor changes the dbReference and sequence elements, so it gets its own
+    elements = ET.parse(args.filename).getroot().findall(uniprot + 'entry')
+    extractors = [(extract_entry_findall, ET.parse(args.filename).getroot().findall(uniprot + 'entry')),
+                  (extractor.walk, elements), (extract_entry, elements)]
+    (findall, walk, extract), (_, walk_ratio, extract_ratio) = compare(
+        extractors, args.repeat, args.rounds)
+    print("findall:            {t:.1f} us per entry".format(t=findall * 1e6))
+    print("single pass:        {t:.1f} us per entry, {x} (median of the rounds)".format(
+        t=walk * 1e6, x=speed(walk_ratio)))
+    print("resolving evidence: {t:.1f} us per entry more, single pass and evidence {x} than "
+          "findall".format(t=(extract - walk) * 1e6, x=speed(extract_ratio)))
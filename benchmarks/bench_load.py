@@ -0,0 +1,107 @@
+# Benchmark of loading without a DBMS: parsing and writing are measured separately, the
+# writing against the recording FakeDriver. Every stage runs in a fresh process, so the
+# peak RSS reported is that of the stage alone. Reports entries/s, peak RSS, and the
+# number of queries and transactions the writer needed.
+#
+#   python benchmarks/bench_load.py --entries 2000
+#   python benchmarks/bench_load.py uniprot_sprot.xml --json results.json
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+
+def parse_stage(filename, workers):
+    from graphmaker import iter_entries, iter_entries_parallel
+    start = time.perf_counter()
+    if workers > 1:
+        n = sum(1 for entry in iter_entries_parallel(filename, workers))
+    else:
+        n = sum(1 for entry in iter_entries(filename))
+    seconds = time.perf_counter() - start
+    return {'stage': 'parse', 'entries': n, 'seconds': seconds, 'peak_rss_mb': peak_rss_mb()}
+
+
+def write_stage(filename, mode, batch_size, quiet, latency):
+    from fakedriver import FakeDriver
+    from graphmaker import iter_entries, load_entry
+    from neo4japp import App
+    # The entries are extracted up front, so only the writing is timed
+    entries = list(iter_entries(filename))
+    driver = FakeDriver(latency)
+    app = App(None, None, None, quiet=quiet, driver=driver)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'per-entry':
+            for entry in entries:
+                load_entry(app, entry)
+        else:
+            app.load(entries, batch_size=batch_size)
+    seconds = time.perf_counter() - start
+    return {'stage': 'write ' + mode, 'entries': len(entries), 'seconds': seconds,
+            'peak_rss_mb': peak_rss_mb(), 'queries': driver.queries,
+            'transactions': driver.transactions}
+
+
+def run_in_process(function, *args):
+    """Run the stage in a fresh interpreter, so its peak RSS doesn't include earlier stages.
+    Unlike those of multiprocessing.Pool, the process isn't daemonic, so the parse stage
+    can start the processes of --workers."""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, *args).result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parsing and writing without a DBMS")
+    parser.add_argument('filename', nargs='?',
+                        help="UniProt xml file, a synthetic one is generated if not given")
+    parser.add_argument('--entries', type=int, default=1000,
+                        help="number of entries of the synthetic file")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--quiet', action='store_true', help="run the writers in quiet mode")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds every query of the fake driver takes, e.g. 0.0005")
+    parser.add_argument('--json', metavar='FILE', help="also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = args.filename
+        if filename is None:
+            from synthetic import write_synthetic
+            filename = os.path.join(directory, 'synthetic.xml')
+            write_synthetic(filename, args.entries)
+
+        results = [run_in_process(parse_stage, filename, args.workers),
+                   run_in_process(write_stage, filename, 'per-entry', args.batch_size, args.quiet,
+                                  args.latency),
+                   run_in_process(write_stage, filename, 'batched', args.batch_size, args.quiet,
+                                  args.latency)]
+
+    for result in results:
+        print("{stage:>17}: {entries} entries in {seconds:.2f}s, {rate:.0f} entries/s, "
+              "peak RSS {peak_rss_mb:.0f} MB".format(rate=result['entries'] / result['seconds'],
+                                                      **result), end='')
+        if 'queries' in result:
+            print(", {queries} queries in {transactions} transactions".format(**result), end='')
+        print()
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
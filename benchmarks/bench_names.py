@@ -0,0 +1,55 @@
+# Compare writing the protein names with apoc.create.relationship (one query, dynamic
+# relationship type) against grouping them by type on the client (one static query per type).
+# Needs a running DBMS with APOC, as described in the README. The database is cleared between runs!
+#
+#   python benchmarks/bench_names.py Q9Y261.xml --copies 1000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from graphmaker import iter_entries
+from neo4japp import App
+
+
+def run(app, work, entries):
+    """Write the names of all entries with work, return the time and the resulting relationship counts"""
+    app.clear_db()
+    with app.driver.session(database="neo4j") as session:
+        session.run("UNWIND $ids AS id CREATE (:Protein {id: id})",
+                    ids=[entry.protein_id for entry in entries]).consume()
+        start = time.perf_counter()
+        for entry in entries:
+            session.execute_write(work, entry.protein_id, entry.protein_name_list)
+        seconds = time.perf_counter() - start
+        counts = {row["type"]: row["count"] for row in session.run(
+            "MATCH (:Protein)-[r]->(:Name) RETURN type(r) AS type, count(r) AS count")}
+    return seconds, counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare APOC and grouped name writes")
+    parser.add_argument('filename')
+    parser.add_argument('--copies', type=int, default=1000)
+    parser.add_argument('--uri', default="bolt://localhost:7687")
+    parser.add_argument('--user', default="neo4j")
+    parser.add_argument('--password', default="Very-Strong-Password")
+    args = parser.parse_args()
+
+    entries = [entry._replace(protein_id="{id}-{i}".format(id=entry.protein_id, i=i))
+               for i in range(args.copies) for entry in iter_entries(args.filename)]
+    app = App(args.uri, args.user, args.password)
+    app.ensure_schema()
+
+    results = {}
+    for name, work in [('apoc', App._create_proteinnames_apoc),
+                       ('grouped', App._create_proteinnames)]:
+        seconds, counts = results[name] = run(app, work, entries)
+        print("{name:>8}: {n} entries in {s:.2f}s, {rate:.1f} entries/s".format(
+            name=name, n=len(entries), s=seconds, rate=len(entries) / seconds))
+    print("same graph:", results['apoc'][1] == results['grouped'][1])
+    app.clear_db()
+    app.close()
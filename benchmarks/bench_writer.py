@@ -0,0 +1,61 @@
+# Throughput comparison of the per-entry write path (one transaction per section per
+# entry) against the batched path (one transaction per batch of entries).
+# Needs a running DBMS, as described in the README. The database is cleared between runs!
+#
+#   python benchmarks/bench_writer.py Q9Y261.xml --copies 200 --batch-size 100
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from graphmaker import iter_entries, load_entry
+from neo4japp import App
+
+
+def copy_entries(entries, copies):
+    """Repeat the entries under new accessions, so small files give a useful workload"""
+    for i in range(copies):
+        for entry in entries:
+            yield entry._replace(protein_id="{id}-{i}".format(id=entry.protein_id, i=i))
+
+
+def timed(app, run, entries):
+    app.clear_db()
+    start = time.perf_counter()
+    # The write paths print every row, keep that out of the measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        run(entries)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-entry and batched writes")
+    parser.add_argument('filename')
+    parser.add_argument('--copies', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--uri', default="bolt://localhost:7687")
+    parser.add_argument('--user', default="neo4j")
+    parser.add_argument('--password', default="Very-Strong-Password")
+    args = parser.parse_args()
+
+    entries = list(copy_entries(list(iter_entries(args.filename)), args.copies))
+    app = App(args.uri, args.user, args.password)
+
+    def per_entry(entries):
+        for entry in entries:
+            load_entry(app, entry)
+
+    def batched(entries):
+        app.load(entries, batch_size=args.batch_size)
+
+    for name, run in [('per-entry', per_entry), ('batched', batched)]:
+        seconds = timed(app, run, entries)
+        print("{name:>10}: {n} entries in {s:.2f}s, {rate:.1f} entries/s".format(
+            name=name, n=len(entries), s=seconds, rate=len(entries) / seconds))
+    app.clear_db()
+    app.close()
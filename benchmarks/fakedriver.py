@@ -0,0 +1,91 @@
+# In-process stand-in for the Neo4j driver, to run App without a DBMS. It doesn't
+# execute anything, it only records the queries and transactions it is given, so the
+# client side of loading can be measured on its own.
+#
+#   app = App(None, None, None, driver=FakeDriver())
+
+import time
+from collections import Counter
+
+
+class FakeCounters:
+    """Every counter of a result summary is 0"""
+
+    def __getattr__(self, name):
+        return 0
+
+
+class FakeSummary:
+    counters = FakeCounters()
+
+
+class FakeResult:
+    """A result without rows"""
+
+    def __iter__(self):
+        return iter(())
+
+    def consume(self):
+        return FakeSummary()
+
+    def single(self):
+        # Used for counts, as in clear_db
+        return {"n": 0}
+
+
+class FakeTransaction:
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, parameters=None, **kwargs):
+        self.driver.queries += 1
+        self.driver.query_texts[query] += 1
+        if self.driver.latency:
+            time.sleep(self.driver.latency)
+        return FakeResult()
+
+
+class FakeSession:
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self, query, parameters=None, **kwargs):
+        # An auto-commit transaction
+        self.driver.transactions += 1
+        return FakeTransaction(self.driver).run(query, parameters, **kwargs)
+
+    def execute_write(self, transaction_function, *args, **kwargs):
+        self.driver.transactions += 1
+        return transaction_function(FakeTransaction(self.driver), *args, **kwargs)
+
+    execute_read = execute_write
+
+
+class FakeDriver:
+    """Records the number of sessions, transactions and queries. With latency, every
+    query waits that many seconds, as a rough stand-in for the round trip to the server."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sessions = 0
+        self.transactions = 0
+        self.queries = 0
+        self.query_texts = Counter()
+
+    def session(self, **kwargs):
+        self.sessions += 1
+        return FakeSession(self)
+
+    def close(self):
+        pass
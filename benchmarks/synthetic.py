@@ -0,0 +1,146 @@
+# Generator of synthetic UniProt xml files of any size, shaped like Q9Y261.xml: names,
+# genes, organism, references with author lists, dbReferences with properties, keywords,
+# features with locations and evidence, evidence with sources, and a sequence.
+# Genes, authors, keywords and organisms are drawn from small pools, so they are shared
+# between entries like in a real dump.
+#
+#   python benchmarks/synthetic.py synthetic.xml --entries 10000
+
+import argparse
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+HEADER = ('<?xml version="1.0" encoding="UTF-8"  standalone="no" ?>\n'
+          '<uniprot xmlns="http://uniprot.org/uniprot" '
+          'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n')
+FOOTER = ('<copyright>\nSynthetic data for benchmarks\n</copyright>\n'
+          '</uniprot>\n')
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+ORGANISMS = [('Homo sapiens', 'Human', '9606'), ('Mus musculus', 'Mouse', '10090'),
+             ('Rattus norvegicus', 'Rat', '10116'), ('Danio rerio', 'Zebrafish', '7955'),
+             ('Saccharomyces cerevisiae', "Baker's yeast", '559292')]
+FEATURE_TYPES = ['chain', 'domain', 'region of interest', 'modified residue', 'strand',
+                 'helix', 'sequence variant', 'mutagenesis site', 'binding site']
+DBREFERENCE_TYPES = {'EMBL': ['protein sequence ID', 'molecule type'],
+                     'RefSeq': ['nucleotide sequence ID'],
+                     'PDB': ['method', 'resolution', 'chains'],
+                     'GO': ['term', 'evidence', 'project'],
+                     'InterPro': ['entry name'],
+                     'Pfam': ['entry name', 'match status']}
+
+
+def word(rng, length=8):
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(length))
+
+
+def entry_xml(rng, number, references=10, authors=8, features=25, dbreferences=60, keywords=10):
+    """The xml of a single entry. The number of items per section varies around the given sizes"""
+    def vary(n):
+        return rng.randint(max(n // 2, 1), n + n // 2)
+
+    accession = 'S{n:07d}'.format(n=number)
+    lines = ['<entry dataset="Swiss-Prot" created="2000-05-30" modified="2022-12-14" '
+             'version="{v}" xmlns="http://uniprot.org/uniprot">'.format(v=rng.randint(1, 200)),
+             '  <accession>{a}</accession>'.format(a=accession),
+             '  <accession>T{n:07d}</accession>'.format(n=number),
+             '  <name>{a}_SYNTH</name>'.format(a=accession),
+             '  <protein>',
+             '    <recommendedName>',
+             '      <fullName>Synthetic protein {w}</fullName>'.format(w=word(rng)),
+             '      <shortName>{w}</shortName>'.format(w=word(rng, 5).upper()),
+             '    </recommendedName>',
+             '    <alternativeName>',
+             '      <fullName>Alternative {w}</fullName>'.format(w=word(rng)),
+             '    </alternativeName>',
+             '  </protein>',
+             '  <gene>',
+             '    <name type="primary">GENE{g}</name>'.format(g=rng.randint(1, 20000)),
+             '    <name type="synonym">SYN{g}</name>'.format(g=rng.randint(1, 20000)),
+             '  </gene>']
+    scientific, common, taxonomy = rng.choice(ORGANISMS)
+    lines += ['  <organism>',
+              '    <name type="scientific">{s}</name>'.format(s=escape(scientific)),
+              '    <name type="common">{c}</name>'.format(c=escape(common)),
+              '    <dbReference type="NCBI Taxonomy" id="{t}"/>'.format(t=taxonomy),
+              '  </organism>']
+    for key in range(1, vary(references) + 1):
+        pubmed = rng.randint(1000000, 40000000)
+        lines += ['  <reference key="{k}">'.format(k=key),
+                  '    <citation type="journal article" date="{y}" name="J. {j}" volume="{v}" '
+                  'first="{f}" last="{l}">'.format(y=rng.randint(1980, 2023), j=word(rng, 6),
+                                                   v=rng.randint(1, 300), f=key * 10, l=key * 10 + 9),
+                  '      <title>A study of {a} {b} {c}.</title>'.format(
+                      a=word(rng), b=word(rng), c=word(rng)),
+                  '      <authorList>']
+        lines += ['        <person name="{s} {i}."/>'.format(
+                      s=word(rng, 6).capitalize(), i=rng.choice('ABCDEFGH'))
+                  for _ in range(vary(authors))]
+        lines += ['      </authorList>',
+                  '      <dbReference type="PubMed" id="{p}"/>'.format(p=pubmed),
+                  '      <dbReference type="DOI" id="10.1000/{p}"/>'.format(p=pubmed),
+                  '    </citation>',
+                  '    <scope>NUCLEOTIDE SEQUENCE [MRNA]</scope>',
+                  '  </reference>']
+    evidence_keys = list(range(1, 14))
+    for _ in range(vary(dbreferences)):
+        db_type = rng.choice(list(DBREFERENCE_TYPES))
+        lines.append('  <dbReference type="{t}" id="{t}{i}">'.format(t=db_type, i=rng.randint(1, 10 ** 6)))
+        lines += ['    <property type="{p}" value="{v}"/>'.format(p=prop, v=word(rng))
+                  for prop in DBREFERENCE_TYPES[db_type]]
+        lines.append('  </dbReference>')
+    for _ in range(vary(keywords)):
+        number = rng.randint(1, 1200)
+        lines.append('  <keyword id="KW-{n:04d}">Keyword {n}</keyword>'.format(n=number))
+    length = rng.randint(100, 1000)
+    for _ in range(vary(features)):
+        feature_type = rng.choice(FEATURE_TYPES)
+        begin = rng.randint(1, length - 1)
+        lines.append('  <feature type="{t}" description={d} evidence="{e}">'.format(
+            t=feature_type, d=quoteattr('Feature ' + word(rng, 4)),
+            e=' '.join(str(k) for k in rng.sample(evidence_keys, rng.randint(1, 2)))))
+        if feature_type == 'sequence variant':
+            lines += ['    <original>A</original>', '    <variation>T</variation>']
+        if rng.random() < 0.5:
+            lines += ['    <location>', '      <position position="{p}"/>'.format(p=begin),
+                      '    </location>']
+        else:
+            lines += ['    <location>',
+                      '      <begin position="{b}"/>'.format(b=begin),
+                      '      <end position="{e}"/>'.format(e=rng.randint(begin, length)),
+                      '    </location>']
+        lines.append('  </feature>')
+    for key in evidence_keys:
+        lines += ['  <evidence type="ECO:0000269" key="{k}">'.format(k=key),
+                  '    <source>',
+                  '      <dbReference type="PubMed" id="{p}"/>'.format(p=rng.randint(1000000, 40000000)),
+                  '    </source>',
+                  '  </evidence>']
+    lines += ['  <sequence length="{n}" mass="{m}" checksum="{c:016X}" modified="1999-11-01" '
+              'version="1">{s}</sequence>'.format(n=length, m=length * 110, c=rng.getrandbits(64),
+                                                  s=''.join(rng.choice(AMINO_ACIDS) for _ in range(length))),
+              '</entry>']
+    return '\n'.join(lines) + '\n'
+
+
+def write_synthetic(filename, entries, seed=0, **sizes):
+    """Write a file with this many entries. The same seed always gives the same file"""
+    rng = random.Random(seed)
+    with open(filename, 'w', encoding='utf-8') as file:
+        file.write(HEADER)
+        for number in range(entries):
+            file.write(entry_xml(rng, number, **sizes))
+        file.write(FOOTER)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic UniProt xml file")
+    parser.add_argument('filename')
+    parser.add_argument('--entries', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--references', type=int, default=10)
+    parser.add_argument('--features', type=int, default=25)
+    parser.add_argument('--dbreferences', type=int, default=60)
+    args = parser.parse_args()
+    write_synthetic(args.filename, args.entries, args.seed, references=args.references,
+                    features=args.features, dbreferences=args.dbreferences)
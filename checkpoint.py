@@ -0,0 +1,83 @@
+# Record of how far a load has come: the last entry that has been committed, together with
+# all entries before it, and its byte offset in the input file. After a crash, the load
+# can be resumed from there instead of clearing the database and starting over.
+
+import json
+import os
+import threading
+from collections import deque
+
+
+class Checkpoint:
+
+    def __init__(self, path, filename):
+        self.path = path
+        self.filename = os.path.abspath(filename)
+        self.size = os.path.getsize(filename)
+        # Offsets of the entries handed to the writer, in the order of the file, and the
+        # protein_id of those among them that have been committed
+        self.pending = deque()
+        self.done = {}
+        self.entries = 0
+        # The async loader hands out entries in its parsing thread, and commits in the event loop
+        self.lock = threading.Lock()
+
+    def read(self):
+        """The saved checkpoint of this file as a dict with the offset and protein_id of the
+        last committed entry, or None if there is none. Raises ValueError if it was made
+        for another file."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as file:
+            saved = json.load(file)
+        if (saved['filename'], saved['size']) != (self.filename, self.size):
+            raise ValueError("Checkpoint {path} is of {f} ({s} bytes), not of this file".format(
+                path=self.path, f=saved['filename'], s=saved['size']))
+        self.entries = saved['entries']
+        return saved
+
+    def track(self, entries):
+        """Pass the entries through on their way to the writer, remembering their order"""
+        for entry in entries:
+            with self.lock:
+                self.pending.append(entry.offset)
+            yield entry
+
+    def committed(self, entries):
+        """Call this with every batch once it has been committed. Batches may be committed
+        out of order, the checkpoint only moves on once all entries before them are in too."""
+        with self.lock:
+            for entry in entries:
+                self.done[entry.offset] = entry.protein_id
+            last = None
+            while self.pending and self.pending[0] in self.done:
+                offset = self.pending.popleft()
+                last = (offset, self.done.pop(offset))
+                self.entries += 1
+            if last:
+                self.save(*last)
+
+    def save(self, offset, protein_id):
+        # Written to a temporary file first, so a crash never leaves half a checkpoint
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'filename': self.filename, 'size': self.size, 'offset': offset,
+                       'protein_id': protein_id, 'entries': self.entries}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+    def skip_committed(self, entries, saved):
+        """Drop the first entry, the last committed one, which is where the offset of the
+        saved checkpoint points"""
+        entries = iter(entries)
+        first = next(entries, None)
+        if first is not None and first.protein_id != saved['protein_id']:
+            raise ValueError("Expected entry {expected} at offset {offset}, found {found}".format(
+                expected=saved['protein_id'], offset=saved['offset'], found=first.protein_id))
+        yield from entries
+
+    def remove(self):
+        """Remove the checkpoint once the load has finished"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
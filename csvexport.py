@@ -0,0 +1,198 @@
+# Offline output backend: instead of writing to a running DBMS like App does, write the
+# extracted entries to node and relationship csv files for neo4j-admin bulk import,
+# which is much faster when building a fresh database from a full dump:
+#
+#   neo4j-admin database import full neo4j @<directory>/import.args
+#
+# The resulting graph is the same as the one App.load() creates.
+
+import csv
+import os
+from collections import OrderedDict
+from sequencestore import is_shared
+
+
+def string_array(values):
+    """A list as a string[] column, in which neo4j-admin splits values at ';'"""
+    return ';'.join(values) if values else None
+
+
+class CsvExporter:
+
+    # Number of csv files kept open at the same time. Labels like dbReference get a file
+    # for every distinct set of properties, so there can be many more files than this.
+    max_open_files = 64
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # (kind, label or type, columns) -> filename, in order of creation
+        self.files = OrderedDict()
+        self._open = OrderedDict()
+        # Ids of shared nodes that have already been written, to write them only once
+        self.seen = {label: set() for label in
+                     ('Gene', 'Author', 'Keyword', 'Organism', 'Name', 'Feature')}
+
+    def close(self):
+        for handle, writer in self._open.values():
+            handle.close()
+        self._open.clear()
+        self.write_args()
+
+    def write_args(self):
+        """Write import.args, listing every file for the neo4j-admin import command"""
+        path = os.path.join(self.directory, 'import.args')
+        with open(path, 'w', encoding='utf-8') as handle:
+            for (kind, name, columns), filename in self.files.items():
+                option = '--nodes' if kind == 'nodes' else '--relationships'
+                handle.write('{option}={name}={file}\n'.format(
+                    option=option, name=name, file=os.path.abspath(filename)))
+        print("Wrote {n} csv files, import them with: neo4j-admin database import full "
+              "neo4j @{path}".format(n=len(self.files), path=path))
+
+    def _writer(self, kind, name, columns, header):
+        """Get the csv writer for this label/type and set of columns, creating the file
+        with its header the first time it is used"""
+        key = (kind, name, columns)
+        if key in self._open:
+            self._open.move_to_end(key)
+            return self._open[key][1]
+        if key in self.files:
+            handle = open(self.files[key], 'a', newline='', encoding='utf-8')
+            writer = csv.writer(handle)
+        else:
+            number = sum(1 for k, n, c in self.files if k == kind and n == name)
+            filename = os.path.join(self.directory, '{kind}_{name}{suffix}.csv'.format(
+                kind=kind, name=name.replace(' ', '_'),
+                suffix='_{n}'.format(n=number) if number else ''))
+            self.files[key] = filename
+            handle = open(filename, 'w', newline='', encoding='utf-8')
+            writer = csv.writer(handle)
+            writer.writerow(header)
+        if len(self._open) >= self.max_open_files:
+            _, (oldest, _) = self._open.popitem(last=False)
+            oldest.close()
+        self._open[key] = (handle, writer)
+        return writer
+
+    def node(self, label, node_id, properties):
+        """Write a node. Empty fields are not set as a property by neo4j-admin,
+        so the columns only need to cover this node's properties"""
+        if label in self.seen:
+            if node_id in self.seen[label]:
+                return
+            self.seen[label].add(node_id)
+        columns = tuple(properties)
+        # The id column is not stored as a property, properties like dbReference.id are
+        header = [':ID({label})'.format(label=label)] + list(columns)
+        self._writer('nodes', label, columns, header).writerow(
+            [node_id] + [properties[column] for column in columns])
+
+    def relationship(self, rel_type, start_label, start_id, end_label, end_id, properties=None):
+        properties = properties or {}
+        columns = tuple(properties)
+        header = [':START_ID({label})'.format(label=start_label),
+                  ':END_ID({label})'.format(label=end_label)] + list(columns)
+        self._writer('relationships', rel_type, (start_label, end_label) + columns, header).writerow(
+            [start_id, end_id] + [properties[column] for column in columns])
+
+    def evidence_links(self, label, node_id, protein_id, evidence_ids, linked):
+        """Link a shared name or feature to the evidence it has in this protein, once, like
+        the MERGE of App. linked has the links of the entry that were written already."""
+        for evidence_id in evidence_ids or ():
+            if (label, node_id, evidence_id) in linked:
+                continue
+            linked.add((label, node_id, evidence_id))
+            self.relationship('HAS_EVIDENCE', label, node_id, 'Evidence', evidence_id,
+                              {'protein_id': protein_id})
+
+    def load(self, entries):
+        for entry in entries:
+            self.write_entry(entry)
+
+    def write_entry(self, entry):
+        """Write all nodes and relationships of one extracted entry (see graphmaker.extract_entry)"""
+        protein_id = entry.protein_id
+        self.node('Protein', protein_id, {'id': protein_id})
+        # Links of shared names and features to the evidence of this entry
+        linked = set()
+
+        for pnl in entry.protein_name_list:
+            name_id = '{type}|{name}'.format(type=pnl['recalt'], name=pnl['name'])
+            self.node('Name', name_id, {'name': pnl['name'], 'type': pnl['recalt']})
+            # Names and features are shared, the evidence of this entry goes on the link. A
+            # column name can have the type of the column, as in the header of neo4j-admin.
+            self.relationship(pnl['has'], 'Protein', protein_id, 'Name', name_id,
+                              {'evidence_ids:string[]': string_array(pnl['evidence_ids'])})
+            self.evidence_links('Name', name_id, protein_id, pnl['evidence_ids'], linked)
+
+        for gl in entry.gene_list:
+            self.node('Gene', gl['name'], {'name': gl['name']})
+            self.relationship('FROM_GENE', 'Protein', protein_id, 'Gene', gl['name'],
+                              {'status': gl['type']})
+
+        ol = entry.organism_dict
+        self.node('Organism', ol['id'], {'name': ol.get('scientificName'), 'taxonomy_id': ol['id']})
+        self.relationship('IN_ORGANISM', 'Protein', protein_id, 'Organism', ol['id'])
+
+        # References, dbReferences and sequences belong to a single protein
+        for rl in entry.reference_list:
+            ref_id = '{pr}:{key}'.format(pr=protein_id, key=rl['key'])
+            self.node('Reference', ref_id, rl)
+            self.relationship('HAS_REFERENCE', 'Protein', protein_id, 'Reference', ref_id)
+
+        for al in entry.author_list:
+            ref_id = '{pr}:{key}'.format(pr=protein_id, key=al['ref_key'])
+            self.node('Author', al['name'], {'name': al['name']})
+            self.relationship('HAS_AUTHOR', 'Reference', ref_id, 'Author', al['name'])
+
+        for i, drl in enumerate(entry.dbref_list):
+            dbref_id = '{pr}:{i}'.format(pr=protein_id, i=i)
+            self.node('dbReference', dbref_id, drl)
+            self.relationship('HAS_DBREFERENCE', 'Protein', protein_id, 'dbReference', dbref_id)
+
+        for kl in entry.keyword_list:
+            self.node('Keyword', kl['id'], {'keyword': kl['keyword'], 'id': kl['id']})
+            self.relationship('HAS_KEYWORD', 'Protein', protein_id, 'Keyword', kl['id'])
+
+        for fl in entry.feature_list:
+            feature_id = '{name}|{type}|{evidence}'.format(**fl)
+            self.node('Feature', feature_id,
+                      {'name': fl['name'], 'type': fl['type'], 'evidence': fl['evidence']})
+            self.relationship('HAS_FEATURE', 'Protein', protein_id, 'Feature', feature_id,
+                              {'begin': fl.get('begin'), 'end': fl.get('end'),
+                               'position': fl.get('position'),
+                               'evidence_ids:string[]': string_array(fl['evidence_ids'])})
+            self.evidence_links('Feature', feature_id, protein_id, fl['evidence_ids'], linked)
+
+        # Evidence keys are only unique within an entry, so evidence belongs to one protein
+        for el in entry.evidence_list:
+            evidence_id = '{pr}:{key}'.format(pr=protein_id, key=el['key'])
+            self.node('Evidence', evidence_id,
+                      {'id': evidence_id, 'type': el['type'], 'key': el['key'],
+                       'source': el.get('sourcetype'), 'source_id': el.get('sourceid')})
+            self.relationship('HAS_EVIDENCE', 'Protein', protein_id, 'Evidence', evidence_id)
+
+        # The links of the references were resolved by graphmaker, one per evidence key
+        for link in entry.evidence_link_list:
+            ref_id = '{pr}:{key}'.format(pr=protein_id, key=link['ref_key'])
+            self.relationship('HAS_EVIDENCE', 'Reference', ref_id, 'Evidence',
+                              '{pr}:{key}'.format(pr=protein_id, key=link['key']))
+
+        sl = entry.sequence_dict
+        if is_shared(sl):
+            # A single node per checksum, the other attributes on the link, see sequencestore
+            if 'residues' in sl:
+                raise ValueError("Compressed residues can't be imported by neo4j-admin, "
+                                 "store the sequences in full or externally")
+            # Typed, as the length and mass of App's shared nodes are integers. The label makes
+            # them unique on the checksum, see SCHEMA
+            self.seen.setdefault('Sequence', set())
+            self.node('Sequence', sl['checksum'],
+                      {':LABEL': 'SharedSequence', 'checksum': sl['checksum'],
+                       'length:int': sl['length'], 'mass:long': sl['mass']})
+            self.relationship('HAS_SEQUENCE', 'Protein', protein_id, 'Sequence', sl['checksum'],
+                              sl['link'])
+        else:
+            self.node('Sequence', protein_id, sl)
+            self.relationship('HAS_SEQUENCE', 'Protein', protein_id, 'Sequence', protein_id)
@@ -0,0 +1,70 @@
+# Scanner for the <entry> elements in the raw bytes of an uncompressed UniProt xml file,
+# without parsing the xml. It gives graphmaker the byte offset of every entry it parses and
+# the shards of the worker processes, and accessionindex the entries it indexes.
+
+import re
+
+# Start of an <entry> element in the raw bytes of the file, and its end
+entry_start = re.compile(rb'<entry[\s>]')
+entry_end = b'</entry>'
+
+# Root element put around entries read from the middle of the file, so they form a document
+root_start = b'<uniprot xmlns="http://uniprot.org/uniprot">'
+root_end = b'</uniprot>'
+
+
+class EntryScanner:
+    """Finds the entries in the blocks of a file that are fed to it in order. Only the
+    bytes of an entry that isn't complete yet are kept between blocks."""
+
+    def __init__(self, start=0):
+        self.buffer = b''
+        # Offset in the file of the start of buffer; start is that of the first block
+        self.base = start
+
+    def feed(self, block):
+        """Yields (offset, length, data) of every entry that ends in this block, data being
+        a memoryview of the bytes of the entry"""
+        buffer = self.buffer + block
+        view = memoryview(buffer)
+        position = 0
+        while True:
+            match = entry_start.search(buffer, position)
+            if match is None:
+                # Keep enough for a tag split over two blocks
+                keep = max(position, len(buffer) - len(entry_end))
+                break
+            end = buffer.find(entry_end, match.end())
+            if end == -1:
+                # The entry goes on in the next block
+                keep = match.start()
+                break
+            end += len(entry_end)
+            yield self.base + match.start(), end - match.start(), view[match.start():end]
+            position = end
+        self.base += keep
+        self.buffer = buffer[keep:]
+
+
+def scan_entries(filename, blocksize=1 << 24, start=0):
+    """Yields (offset, length, data) of every entry in the file from start on, see
+    EntryScanner.feed"""
+    scanner = EntryScanner(start)
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        while True:
+            block = file.read(blocksize)
+            if not block:
+                return
+            yield from scanner.feed(block)
+
+
+def scan_entry_offsets(filename, blocksize=1 << 24, start=0):
+    """Scan the raw bytes of the file for the start offset of every <entry> from start on,
+    without parsing it. Returns the list of offsets and the offset just after the last </entry>"""
+    offsets = []
+    end = 0
+    for offset, length, data in scan_entries(filename, blocksize, start):
+        offsets.append(offset)
+        end = offset + length
+    return offsets, end
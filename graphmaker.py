@@ -2,149 +2,621 @@
 # This code is based on the example code from the Neo4j Python Driver
 # https://neo4j.com/docs/api/python-driver/current/
 
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
 import xml.etree.ElementTree as ET
-from neo4japp import App
-
-
-# Load in data, get the entry section with all relevant data
-filename = r"C:\Users\danie\OneDrive\Documents\weavechallenge\Q9Y261.xml"
-tree = ET.parse(filename)
-root = tree.getroot()
-entry = root[0]
-
-# Finding the xmlns
-uniprot = entry.tag.split('entry')[0]
-
-# Extract the first accession number as the protein_id
-protein_id = entry.find(uniprot+'accession').text
-
-# Get all names for the protein and create the names for the relationships
-proteins = entry.find(uniprot+'protein')
-protein_name_list = []
-for child in proteins:
-    for branch in child:
-        proteindata = {'recalt' : child.tag[28:], 'name': branch.text}
-        proteindata['has'] = "HAS_"+branch.tag[28:-4].upper()+'_'+'NAME'  # relationship name
-        protein_name_list.append(proteindata)
-        
-# If we only want the recommended names, use:
-    
-# recprotein = entry.find(uniprot+'protein').find(uniprot+'recommendedName')
-# protein_name_list = []
-# for child in recprotein:
-#     proteindata = {'name' : child.text}
-#     proteindata['has'] = "HAS_"+child.tag[28:-4].upper()+'_'+'NAME'  # relationship name
-#     protein_name_list.append(proteindata)
-
-# Extract gene data from the entry
-genes = entry.find(uniprot+'gene')
-gene_list = []
-for gene in genes:
-    genedata = {'name' : gene.text, 'type': gene.attrib['type']}
-    gene_list.append(genedata)
-
-# Extract organism with its scientific, common and reference id
-organism = entry.find(uniprot+'organism')
-organism_dict = {}
-for name in organism.findall(uniprot+'name'):
-    organism_dict[name.attrib['type']+'Name'] =  name.text
-ref = organism.find(uniprot+'dbReference')
-organism_dict['id'] = ref.attrib['id']
-
-# Extract references
-# We make a separate list of authors that will be linked to the references through the key
-references = entry.findall(uniprot+'reference')
-reference_list = []
-author_list = []       
-for ref in references:
-    refdata = {}
-    refdata['key'] = ref.attrib['key']
-    citation = ref.find(uniprot+'citation')
-    refdata.update(citation.attrib)
-    title = citation.find(uniprot+'title')
-    refdata['title'] = title.text
-    reference_list.append(refdata)
-    authorlist = citation.find(uniprot+'authorList')
-    for author in authorlist:
-        authors = {'name': author.attrib['name'], 'ref_key' : ref.attrib['key']}
-        author_list.append(authors)
-    dbref = citation.findall(uniprot+'dbReference')
-    for db in dbref:
-        refdata[db.attrib['type']] = db.attrib['id']
-    scope = ref.find(uniprot+'scope')
-    refdata['scope'] = scope.text
-
-# Extract features. For missing values, we enter 'N/A'
-features = entry.findall(uniprot+'feature')
-feature_list = []
-for feature in features:
-    featdata = {'type' : feature.attrib['type']}
-    if 'description' in feature.attrib:
-        featdata['name'] = feature.attrib['description']
+from collections import deque, namedtuple
+from itertools import groupby
+from operator import attrgetter
+from concurrent.futures import ProcessPoolExecutor
+from neo4japp import App, RETRY_ERRORS, backoff_delays
+from asyncapp import AsyncApp
+from csvexport import CsvExporter
+from statestore import StateStore
+from nodecache import NodeCache
+from checkpoint import Checkpoint
+from metrics import Metrics, Progress
+from inputfile import open_input, is_plain
+from accessionindex import AccessionIndex, read_accessions
+from sequencestore import SEQUENCE_MODES, SequenceStore
+from entryscan import EntryScanner, root_end, root_start, scan_entry_offsets
+
+
+# The example entry that comes with the code
+filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Q9Y261.xml')
+
+# The xmlns used by UniProt, as it is prefixed to every tag by ElementTree
+uniprot = '{http://uniprot.org/uniprot}'
+
+
+# The data extracted from one entry. The lists hold one dict per row, as they are passed
+# to the queries as parameters as they are. Names and features get the ids of their evidence
+# in evidence_ids, evidence_link_list links the references to the evidence keys of this
+# entry. offset is where the entry starts in the file.
+Entry = namedtuple('Entry', [
+    'protein_id', 'version', 'modified', 'protein_name_list', 'gene_list', 'organism_dict',
+    'reference_list', 'author_list', 'dbref_list', 'keyword_list', 'feature_list',
+    'evidence_list', 'evidence_link_list', 'sequence_dict', 'offset'], defaults=[None])
+
+tag_of = attrgetter('tag')
+
+
+class EntryExtractor:
+    """Extracts an <entry> element into an Entry in a single pass over its children. The
+    children of a section are next to each other, so every run of children with the same
+    tag goes to the handler of that tag in one call. The namespaced tags are worked out
+    once, here."""
+
+    def __init__(self, namespace=uniprot):
+        self.namespace = namespace
+        tag = self.tag = {name: namespace + name for name in (
+            'entry', 'accession', 'protein', 'gene', 'organism', 'reference', 'citation', 'title',
+            'authorList', 'dbReference', 'scope', 'name', 'feature', 'location', 'evidence',
+            'keyword', 'sequence', 'property', 'component', 'domain')}
+        # The handler of every tag, and the section it extracts, for the metrics
+        self.handlers = {
+            tag['accession']: ('protein', self.accession),
+            tag['protein']: ('names', self.protein),
+            tag['gene']: ('genes', self.gene),
+            tag['organism']: ('organism', self.organism),
+            tag['reference']: ('references', self.reference),
+            tag['dbReference']: ('dbreferences', self.dbreference),
+            tag['keyword']: ('keywords', self.keyword),
+            tag['feature']: ('features', self.feature),
+            tag['evidence']: ('evidence', self.evidence),
+            tag['sequence']: ('sequence', self.sequence),
+        }
+        # Tags without namespace, and the relationship names of the protein names
+        self.local_names = {namespace + name: name for name in (
+            'recommendedName', 'alternativeName', 'submittedName', 'begin', 'end', 'position')}
+        self.relationships = {}
+
+    def local(self, tag):
+        """The tag without the namespace"""
+        try:
+            return self.local_names[tag]
+        except KeyError:
+            name = self.local_names[tag] = tag[len(self.namespace):]
+            return name
+
+    def extract(self, entry, metrics=None):
+        """Extract the <entry> element. With metrics, the time and number of rows of every
+        section are recorded as stage 'extract <section>', and the time spent resolving the
+        evidence as 'resolve evidence'."""
+        data = self.walk(entry, metrics)
+        if metrics is None:
+            self.resolve_evidence(data)
+        else:
+            start = time.perf_counter()
+            self.resolve_evidence(data)
+            metrics.record('resolve evidence', time.perf_counter() - start,
+                           rows=len(data['evidence_list']))
+        return Entry(**data)
+
+    def walk(self, entry, metrics=None):
+        """The single pass over the children of the <entry> element: the data of every
+        section as a dict of the fields of Entry, before the evidence is resolved"""
+        data = {'protein_id': None, 'version': entry.get('version'),
+                'modified': entry.get('modified'), 'protein_name_list': [], 'gene_list': [],
+                'organism_dict': None, 'reference_list': [], 'author_list': [],
+                'dbref_list': [], 'keyword_list': [], 'feature_list': [], 'evidence_list': [],
+                'evidence_link_list': [], 'sequence_dict': None}
+        handlers = self.handlers
+        if metrics is None:
+            for tag, elems in groupby(entry, tag_of):
+                handler = handlers.get(tag)
+                if handler is not None:
+                    handler[1](elems, data)
+        else:
+            seconds = {}
+            for tag, elems in groupby(entry, tag_of):
+                handler = handlers.get(tag)
+                if handler is not None:
+                    start = time.perf_counter()
+                    handler[1](elems, data)
+                    seconds[handler[0]] = seconds.get(handler[0], 0.0) + time.perf_counter() - start
+            for section, rows in [('names', data['protein_name_list']), ('genes', data['gene_list']),
+                                  ('organism', [data['organism_dict']]),
+                                  ('references', data['reference_list']),
+                                  ('features', data['feature_list']),
+                                  ('evidence', data['evidence_list']),
+                                  ('dbreferences', data['dbref_list']),
+                                  ('keywords', data['keyword_list']),
+                                  ('sequence', [data['sequence_dict']])]:
+                metrics.record('extract ' + section, seconds.get(section, 0.0), rows=len(rows))
+        return data
+
+    @staticmethod
+    def resolve_evidence(data):
+        # An evidence attribute can hold several keys, separated by spaces. The <evidence>
+        # elements come last, so only now the keys can be checked against them: keys the
+        # entry doesn't have are dropped. Evidence keys are only unique within an entry, so
+        # names and features, which are shared by proteins, get the entry-scoped ids of their
+        # evidence for the relationship from this protein. Many features have the same
+        # evidence attribute, which is resolved once.
+        prefix = data['protein_id'] + ':'
+        ids_of = {el['key']: prefix + el['key'] for el in data['evidence_list']}
+        resolved = {None: None, 'N/A': None}
+        get = resolved.get
+        for rows in (data['protein_name_list'], data['feature_list']):
+            for row in rows:
+                evidence = row['evidence']
+                ids = get(evidence, False)
+                if ids is False:
+                    ids = resolved[evidence] = [ids_of[key] for key in evidence.split()
+                                                if key in ids_of] or None
+                row['evidence_ids'] = ids
+        # References belong to this protein and link to their evidence themselves
+        links = data['evidence_link_list']
+        if links:
+            seen = set()
+            data['evidence_link_list'] = [
+                link for link in links if link['key'] in ids_of
+                and (link['key'], link['ref_key']) not in seen
+                and not seen.add((link['key'], link['ref_key']))]
+
+    # Every handler gets the run of elements with its tag, and adds them to data
+
+    def accession(self, elems, data):
+        # The first accession number is the protein_id
+        if data['protein_id'] is None:
+            data['protein_id'] = next(elems).text
+
+    def protein(self, elems, data):
+        # All names of the protein, with the names for the relationships
+        names = data['protein_name_list']
+        relationships = self.relationships
+        # <component> and <domain> hold the names of parts of the protein, in
+        # <recommendedName> etc. of their own, which aren't names of the protein itself
+        nested = (self.tag['component'], self.tag['domain'])
+        for elem in elems:
+            for child in elem:
+                if child.tag in nested:
+                    continue
+                recalt = self.local(child.tag)
+                for branch in child:
+                    has = relationships.get(branch.tag)
+                    if has is None:
+                        has = relationships[branch.tag] = "HAS_"+self.local(branch.tag)[:-4].upper()+'_NAME'
+                    names.append({'recalt': recalt, 'name': branch.text, 'has': has,
+                                  'evidence': branch.get('evidence')})
+
+    def gene(self, elems, data):
+        genes = data['gene_list']
+        for elem in elems:
+            genes.extend([{'name': gene.text, 'type': gene.get('type')} for gene in elem])
+
+    def organism(self, elems, data):
+        # Scientific and common name, and the taxonomy id
+        name_tag = self.tag['name']
+        dbreference_tag = self.tag['dbReference']
+        organism_dict = {}
+        for child in next(elems):
+            if child.tag == name_tag:
+                organism_dict[child.get('type')+'Name'] = child.text
+            elif child.tag == dbreference_tag and 'id' not in organism_dict:
+                organism_dict['id'] = child.get('id')
+        data['organism_dict'] = organism_dict
+
+    def reference(self, elems, data):
+        # The authors are a separate list, they are linked to the references through the key
+        references = data['reference_list']
+        authors = data['author_list']
+        citation_tag = self.tag['citation']
+        title_tag = self.tag['title']
+        author_list_tag = self.tag['authorList']
+        dbreference_tag = self.tag['dbReference']
+        scope_tag = self.tag['scope']
+        links = data['evidence_link_list']
+        for elem in elems:
+            key = elem.get('key')
+            refdata = {'key': key}
+            evidence = elem.get('evidence')
+            if evidence:
+                links.extend({'key': evidence_key, 'ref_key': key}
+                             for evidence_key in evidence.split())
+            for child in elem:
+                if child.tag == citation_tag:
+                    refdata.update(child.attrib)
+                    for part in child:
+                        if part.tag == title_tag:
+                            refdata['title'] = part.text
+                        elif part.tag == author_list_tag:
+                            authors.extend([{'name': author.get('name'), 'ref_key': key}
+                                            for author in part])
+                        elif part.tag == dbreference_tag:
+                            refdata[part.get('type')] = part.get('id')
+                elif child.tag == scope_tag and 'scope' not in refdata:
+                    refdata['scope'] = child.text
+            references.append(refdata)
+
+    def feature(self, elems, data):
+        # For missing values, we enter 'N/A'
+        append = data['feature_list'].append
+        location_tag = self.tag['location']
+        local_names = self.local_names
+        for elem in elems:
+            attrib = elem.attrib
+            featdata = {'type': attrib['type'], 'name': attrib.get('description', 'N/A'),
+                        'evidence': attrib.get('evidence', 'N/A')}
+            # Variants have <original> and <variation> before the location
+            location = elem.find(location_tag)
+            if location is not None:
+                for pos in location:
+                    featdata[local_names.get(pos.tag) or self.local(pos.tag)] = pos.get('position')
+            append(featdata)
+
+    def evidence(self, elems, data):
+        # Enter 'N/A' for missing source type and source data
+        evidences = data['evidence_list']
+        for elem in elems:
+            evidata = {'type': elem.get('type'), 'key': elem.get('key')}
+            if len(elem) > 0:
+                for source in elem[0]:
+                    evidata['sourcetype'] = source.get('type')
+                    evidata['sourceid'] = source.get('id')
+            else:
+                evidata['sourcetype'] = 'N/A'
+                evidata['sourceid'] = 'N/A'
+            evidences.append(evidata)
+
+    def dbreference(self, elems, data):
+        # The dbReferences with their properties, copied so the elements aren't changed
+        append = data['dbref_list'].append
+        property_tag = self.tag['property']
+        for elem in elems:
+            dbdata = elem.attrib.copy()
+            for prop in elem:
+                if prop.tag == property_tag:
+                    dbdata[prop.get('type')] = prop.get('value')
+                else:
+                    dbdata[self.local(prop.tag)+'_id'] = prop.get('id')
+            append(dbdata)
+
+    def keyword(self, elems, data):
+        data['keyword_list'].extend([{'id': elem.get('id'), 'keyword': elem.text} for elem in elems])
+
+    def sequence(self, elems, data):
+        elem = next(elems)
+        sequence_dict = elem.attrib.copy()
+        sequence_dict['sequence'] = elem.text
+        data['sequence_dict'] = sequence_dict
+
+
+extractor = EntryExtractor()
+
+
+def extract_entry(entry, metrics=None):
+    """Extract all relevant data of a single <entry> element into an Entry,
+    ready to be passed to the App.create_* methods"""
+    return extractor.extract(entry, metrics)
+
+
+def iter_entries(source, metrics=None, start=0, stop=None, blocksize=1 << 16):
+    """Generator that yields the extracted data of every <entry> in a UniProt xml file,
+    one at a time. source can be a filename (compressed or not, see inputfile.open_input)
+    or a file object.
+
+    The file is fed to the parser block by block, and every entry is cleared from the tree
+    once it has been extracted, so memory stays flat regardless of the size of the file.
+    The raw bytes are scanned for every entry as well (see entryscan), so each Entry has its
+    offset in the file. start and stop limit it to the entries in that byte range, start
+    has to be the offset of an entry. With metrics, the time spent parsing is recorded as
+    stage 'parse xml'."""
+    file = open_input(source) if isinstance(source, (str, os.PathLike)) else source
+    try:
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        if start:
+            file.seek(start)
+            parser.feed(root_start)
+        entry_tag = uniprot + 'entry'
+        # Offsets of the entries that have been fed to the parser, but not yielded yet
+        offsets = deque()
+        scanner = EntryScanner(start)
+        position = start
+        root = None
+        parse_start = time.perf_counter()
+        while True:
+            size = blocksize if stop is None else min(blocksize, stop - position)
+            block = file.read(size) if size > 0 else b''
+            if block:
+                # An entry is complete in the scanner before the parser can end it
+                offsets.extend(offset for offset, length, data in scanner.feed(block))
+                position += len(block)
+                parser.feed(block)
+            else:
+                if stop is not None:
+                    parser.feed(root_end)
+                parser.close()
+            for event, elem in parser.read_events():
+                if root is None:
+                    root = elem
+                elif event == 'end' and elem.tag == entry_tag:
+                    if metrics:
+                        metrics.record('parse xml', time.perf_counter() - parse_start, rows=1)
+                    yield extract_entry(elem, metrics=metrics)._replace(offset=offsets.popleft())
+                    # Drop the entry and its children, and the reference the root keeps to it
+                    elem.clear()
+                    root.clear()
+                    parse_start = time.perf_counter()
+            if not block:
+                return
+    finally:
+        if file is not source:
+            file.close()
+
+
+def make_shards(offsets, end, entries_per_shard=1000):
+    """Split the entries into byte ranges of entries_per_shard entries each"""
+    shards = []
+    for i in range(0, len(offsets), entries_per_shard):
+        stop = offsets[i + entries_per_shard] if i + entries_per_shard < len(offsets) else end
+        shards.append((offsets[i], stop))
+    return shards
+
+
+def parse_shard(filename, start, stop):
+    """Extract all entries in a byte range of the file. Runs in a worker process,
+    so it returns a plain list of extracted entries"""
+    return list(iter_entries(filename, start=start, stop=stop))
+
+
+def iter_entries_parallel(filename, workers, entries_per_shard=1000, start=0):
+    """Same as iter_entries, but parses the file in shards in a pool of worker processes.
+    Entries are yielded in the order of the file, and only a few shards per worker are
+    in flight at any time, so memory stays bounded when the writer is slower"""
+    offsets, end = scan_entry_offsets(filename, start=start)
+    shards = make_shards(offsets, end, entries_per_shard)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start, stop in shards:
+            pending.append(executor.submit(parse_shard, filename, start, stop))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def iter_indexed_entries(filename, ranges, metrics=None):
+    """The entries in these (offset, length) ranges of an uncompressed file, e.g. from
+    AccessionIndex.lookup, in that order. Only those parts of the file are read."""
+    with open_input(filename) as source:
+        for offset, length in ranges:
+            yield from iter_entries(source, metrics=metrics, start=offset, stop=offset + length)
+
+
+def load_entry(app, entry):
+    """Write one extracted entry to the database, section by section"""
+    app.create_protein(entry.protein_id)
+    app.create_gene(entry.protein_id, entry.gene_list)
+    app.create_organism(entry.protein_id, entry.organism_dict)
+    app.create_references(entry.protein_id, entry.reference_list)
+    app.create_authors(entry.protein_id, entry.author_list)
+    app.create_dbreferences(entry.protein_id, entry.dbref_list)
+    app.create_keywords(entry.protein_id, entry.keyword_list)
+    # In the order of BATCH_QUERIES: the evidence after the references, before the names
+    # and features that link to it
+    app.create_evidence(entry.protein_id, entry.evidence_list, entry.evidence_link_list)
+    app.create_proteinnames(entry.protein_id, entry.protein_name_list)
+    app.create_features(entry.protein_id, entry.feature_list)
+    app.create_sequence(entry.protein_id, entry.sequence_dict)
+
+
+def write_entry(app, entry, replace=False):
+    """load_entry, retried after errors in RETRY_ERRORS like App.write_batch. The sections
+    are written in transactions of their own, so a retry replaces what the failed attempt
+    got written. With replace, the protein is replaced from the first attempt on."""
+    for delay in backoff_delays(app.retries, app.backoff):
+        try:
+            if replace:
+                app.delete_proteins([entry.protein_id])
+            return load_entry(app, entry)
+        except RETRY_ERRORS as exception:
+            logging.warning("Writing entry {pr} failed, retrying in {d:g}s: {exception}".format(
+                pr=entry.protein_id, d=delay, exception=exception))
+            time.sleep(delay)
+            replace = True
+    if replace:
+        app.delete_proteins([entry.protein_id])
+    load_entry(app, entry)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a UniProt xml file into Neo4j")
+    parser.add_argument('filename', nargs='?', default=filename,
+                        help="UniProt xml file, may be compressed with gzip, bzip2 or xz, "
+                             "or - to read it from stdin. May contain any number of entries")
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help="number of entries written per transaction, 0 writes entry by entry")
+    parser.add_argument('--csv', metavar='DIRECTORY',
+                        help="don't connect to Neo4j, write csv files for neo4j-admin import instead")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of processes used to parse the file")
+    parser.add_argument('--quiet', action='store_true',
+                        help="don't print every written row, only report the totals at the end")
+    parser.add_argument('--incremental', metavar='STATE_DB',
+                        help="only load entries that changed since the last load, keeping track of "
+                             "the loaded versions in this sqlite file, instead of clearing the db")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="number of batches written at the same time, more than 1 uses the "
+                             "async driver, with parsing running alongside the writes")
+    parser.add_argument('--metrics', metavar='JSON_FILE',
+                        help="record the time, rows and bytes of every stage and write them to this file")
+    parser.add_argument('--progress', metavar='SECONDS', type=float,
+                        help="print the progress with rate and ETA every this many seconds")
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help="keep track of the last committed entry and its offset in this file")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue a load that stopped, after the entry in the --checkpoint file")
+    parser.add_argument('--retries', type=int, default=5,
+                        help="number of times a batch is written again after the server went away")
+    parser.add_argument('--backoff', metavar='SECONDS', type=float, default=2.0,
+                        help="seconds to wait before the first retry, doubled for every next one")
+    parser.add_argument('--node-cache', metavar='SIZE', type=int, default=100000,
+                        help="number of genes, authors, keywords and organisms per label that are "
+                             "remembered once written, and then MATCHed instead of MERGEd, 0 to turn off")
+    parser.add_argument('--accessions', metavar='FILE',
+                        help="only load the entries with the accessions in this file, one per line, "
+                             "reading just those entries with the --index. They are added to the "
+                             "database without clearing it, replacing older versions of them")
+    parser.add_argument('--index', metavar='INDEX_DB',
+                        help="accession index of the file (see accessionindex.py), built first if "
+                             "it doesn't exist, by default the filename with .idx")
+    parser.add_argument('--sequences', choices=SEQUENCE_MODES, default='full',
+                        help="full: every protein gets its own Sequence node with the amino acid "
+                             "string. compressed/external: one Sequence node per checksum with its "
+                             "length and mass, and the residues compressed on the node, or in the "
+                             "--sequence-store file (see sequencestore.py)")
+    parser.add_argument('--sequence-store', metavar='SEQUENCE_DB', default='sequences.db',
+                        help="sqlite file the residues are added to with --sequences external")
+    args = parser.parse_args()
+    if args.csv and args.sequences == 'compressed':
+        parser.error("--sequences compressed can't be used with --csv, neo4j-admin can't "
+                     "import the compressed residues")
+    if args.accessions and (args.checkpoint or args.workers > 1):
+        parser.error("--accessions can't be used with --checkpoint or --workers")
+    if args.accessions and not is_plain(args.filename):
+        parser.error("--accessions needs an uncompressed file, to read entries from their offset")
+    if args.csv and args.checkpoint:
+        parser.error("--checkpoint can't be used with --csv")
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs the --checkpoint file to resume from")
+    if args.checkpoint and args.filename == '-':
+        parser.error("--checkpoint needs a file to resume from, not stdin")
+    if args.workers > 1 and not is_plain(args.filename):
+        parser.error("--workers needs an uncompressed file, as the workers read parts of it")
+
+    checkpoint = saved = None
+    if args.checkpoint:
+        checkpoint = Checkpoint(args.checkpoint, args.filename)
+        if args.resume:
+            saved = checkpoint.read()
+            if saved is None:
+                parser.error("there is no checkpoint {path} to resume from".format(path=args.checkpoint))
+    start = saved['offset'] if saved else 0
+
+    metrics = Metrics() if args.metrics else None
+    if args.accessions:
+        index_path = args.index or args.filename + '.idx'
+        new_index = not os.path.exists(index_path)
+        index = AccessionIndex(index_path)
+        if new_index:
+            print("Indexed {n} entries in {path}".format(n=index.build(args.filename), path=index_path))
+        try:
+            index.check(args.filename)
+        except ValueError as exception:
+            parser.error(str(exception))
+        ranges, missing = index.lookup(read_accessions(args.accessions))
+        index.close()
+        if missing:
+            print("{n} accessions are not in the file: {a}".format(
+                n=len(missing), a=", ".join(missing[:10]) + (", ..." if len(missing) > 10 else "")))
+        entries = iter_indexed_entries(args.filename, ranges, metrics=metrics)
+        position = None
+        skipped = 0
+    elif args.workers > 1:
+        # The extraction runs in the workers, so it isn't part of the metrics
+        entries = iter_entries_parallel(args.filename, args.workers, start=start)
+        position = None
+        skipped = start
     else:
-        featdata['name'] = 'N/A'
-    if 'evidence' in feature.attrib:
-        featdata['evidence'] = feature.attrib['evidence']
+        source = open_input(args.filename)
+        entries = iter_entries(source, metrics=metrics, start=start)
+        # A compressed input is decompressed from the start, to skip to the checkpoint
+        skipped = 0 if source.compressed else start
+        position = lambda: source.position() - skipped
+    if saved:
+        print("Resuming after entry {id} at offset {offset}, {n} entries were loaded before".format(
+            id=saved['protein_id'], offset=saved['offset'], n=saved['entries']))
+        entries = checkpoint.skip_committed(entries, saved)
+    if args.progress:
+        # The size and position are those of the file on disk, there is no ETA for stdin
+        if args.filename == '-':
+            entries = Progress(args.progress).track(entries)
+        else:
+            entries = Progress(args.progress, os.path.getsize(args.filename) - skipped,
+                               position).track(entries)
+
+    sequences = SequenceStore(args.sequences, args.sequence_store)
+    if args.csv:
+        exporter = CsvExporter(args.csv)
+        exporter.load(sequences.compact(entries))
+        exporter.close()
     else:
-        featdata['evidence'] = 'N/A'
-    for pos in feature[0]:
-        featdata[pos.tag[28:]] = pos.attrib['position']
-    feature_list.append(featdata)
-
-# Extract evidence, enter 'N/A' for missing source type and source data
-evidences = entry.findall(uniprot+'evidence')
-evidence_list =[]
-for evidence in evidences:
-    evidata = {'type': evidence.attrib['type'], 'key': evidence.attrib['key']}
-    if len(evidence)>0:
-        for source in evidence[0]:
-            evidata['sourcetype'] = source.attrib['type']
-            evidata['sourceid'] = source.attrib['id']
-    else:   
-        evidata['sourcetype'] = 'N/A'
-        evidata['sourceid'] = 'N/A'
-    evidence_list.append(evidata)
-
-# Extract dbReferences and their properties
-dbReferences = entry.findall(uniprot+'dbReference')
-dbref_list = []
-for dbref in dbReferences:
-    dbdata = dbref.attrib
-    if len(dbref) > 0:
-        for prop in dbref:
-            if prop.tag[28:] == 'property':
-                dbdata[prop.attrib['type']] = prop.attrib['value']
-            else: dbdata[prop.tag[28:]+'_id'] = prop.attrib['id']
-    dbref_list.append(dbdata)
-
-# Extract keywords
-keywords = entry.findall(uniprot+'keyword')
-keyword_list = []
-for keyword in keywords:
-    keydata = {'id' : keyword.attrib['id'], 'keyword' : keyword.text}
-    keyword_list.append(keydata)
-
-# Extract the sequence of the protein
-sequence = entry.find(uniprot+'sequence')
-sequence_dict = sequence.attrib
-sequence_dict['sequence'] = sequence.text
+        uri = "bolt://localhost:7687"
+        password = "Very-Strong-Password"
+        user = "neo4j"
+        # Shared by both writers; the per-entry writer (--batch-size 0) doesn't use it
+        cache = NodeCache(args.node_cache) if args.node_cache > 0 else None
+        app = App(uri, user, password, quiet=args.quiet, metrics=metrics,
+                  retries=args.retries, backoff=args.backoff, cache=cache, sequences=sequences)
+        store = None
+        if args.incremental:
+            # Skip unchanged entries before anything is sent, replace the changed ones
+            store = StateStore(args.incremental)
+            entries = store.changed(entries)
+        elif not saved and not args.accessions:
+            app.clear_db()
+        missing = app.ensure_schema()
+        if args.concurrency > 1 and any(unique for label, properties, unique in missing):
+            # Without the constraints the concurrent writers can MERGE the same node twice
+            app.close()
+            sys.exit("--concurrency needs the uniqueness constraints above, load with "
+                     "--concurrency 1 or remove the duplicates they report")
+        # Entries after the checkpoint may have been written in part (in a batch committed
+        # out of order, or one whose commit got lost), so a resumed load replaces them. The
+        # entries of --accessions are added to the graph that is there, replacing older versions
+        replace = store is not None or saved is not None or bool(args.accessions)
+        # The residues of the external store are committed first, see SequenceStore.committed
+        entries = sequences.compact(entries)
+        callbacks = [sequences.committed]
+        if store:
+            callbacks.append(store.mark_loaded)
+        if checkpoint:
+            entries = checkpoint.track(entries)
+            callbacks.append(checkpoint.committed)
 
+        def committed(batch):
+            for callback in callbacks:
+                callback(batch)
 
-if __name__ == "__main__":
-    uri = "bolt://localhost:7687"
-    password = "Very-Strong-Password"
-    user = "neo4j"
-    app = App(uri, user, password)
-    app.clear_db()
-    app.create_protein(protein_id)
-    app.create_proteinnames(protein_id, protein_name_list)
-    app.create_gene(protein_id,gene_list)
-    app.create_organism(protein_id, organism_dict)
-    app.create_references(protein_id, reference_list)
-    app.create_authors(author_list)
-    app.create_dbreferences(protein_id, dbref_list)
-    app.create_keywords(protein_id, keyword_list)
-    app.create_features(protein_id, feature_list)
-    app.create_evidence(evidence_list)
-    app.create_sequence(protein_id, sequence_dict)
-    app.close()
+        if args.concurrency > 1:
+            async def load_async():
+                async_app = AsyncApp(uri, user, password, quiet=args.quiet, metrics=metrics,
+                                     retries=args.retries, backoff=args.backoff, cache=cache)
+                try:
+                    await async_app.load(entries, batch_size=args.batch_size or 500,
+                                         concurrency=args.concurrency, replace=replace,
+                                         committed=committed)
+                finally:
+                    await async_app.close()
+                app.counters.update(async_app.counters)
+            asyncio.run(load_async())
+        elif args.batch_size > 0:
+            app.load(entries, batch_size=args.batch_size, replace=replace, committed=committed)
+        else:
+            for entry in entries:
+                write_entry(app, entry, replace)
+                committed([entry])
+        if store:
+            print("Skipped {n} unchanged entries".format(n=store.skipped))
+            store.close()
+        if checkpoint:
+            # Everything is in, there is nothing left to resume
+            print("Loaded {n} entries, removing checkpoint {path}".format(
+                n=checkpoint.entries, path=args.checkpoint))
+            checkpoint.remove()
+        if app.counters:
+            app.report()
+        if cache:
+            cache.report(metrics)
+        app.close()
+    if sequences.connection:
+        print("Stored {n} new sequences in {path}".format(n=sequences.stored, path=args.sequence_store))
+    sequences.close()
+    if metrics:
+        metrics.write_json(args.metrics)
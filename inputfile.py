@@ -0,0 +1,187 @@
+# Opening the input of graphmaker and xmlprinter: an xml file, a file compressed with gzip,
+# bzip2 or xz (like uniprot_sprot.xml.gz as UniProt ships it), or '-' for stdin, which may be
+# compressed as well. Compressed input is decompressed while it is read, without a temporary
+# file, in a separate process (pigz, gzip, xz, ...) if one is installed and otherwise in a
+# thread, so decompressing runs alongside parsing.
+
+import bz2
+import gzip
+import lzma
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+
+# By the first bytes of the file: the function that opens it decompressed, and the programs
+# that can decompress it in a separate process, in order of preference
+COMPRESSIONS = [
+    (b'\x1f\x8b', gzip.open, ['pigz', 'gzip']),
+    (b'BZh', bz2.open, ['lbzip2', 'pbzip2', 'bzip2']),
+    (b'\xfd7zXZ\x00', lzma.open, ['xz']),
+]
+
+
+def compression_of(head):
+    """The entry of COMPRESSIONS for a file starting with these bytes, or None"""
+    for compression in COMPRESSIONS:
+        if head.startswith(compression[0]):
+            return compression
+    return None
+
+
+def open_input(filename, processes=True, blocksize=1 << 20, queue_size=16):
+    """Open filename, or stdin for '-', for reading bytes, decompressing it if it is compressed.
+    With processes, an installed decompression program is used before the Python module."""
+    if filename == '-':
+        raw = sys.stdin.buffer
+        head = raw.peek(8)[:8]
+        size = None
+    else:
+        raw = open(filename, 'rb', buffering=0)
+        head = raw.read(8)
+        raw.seek(0)
+        size = os.path.getsize(filename)
+    compression = compression_of(head)
+    if compression is None:
+        return InputFile(raw, raw, size, compressed=False)
+    magic, decompress, programs = compression
+    # The bytes stdin peeked at are in its buffer, which a process wouldn't get
+    program = next((shutil.which(p) for p in programs if shutil.which(p)), None)
+    if processes and program and filename != '-':
+        process = subprocess.Popen([program, '-dc'], stdin=raw, stdout=subprocess.PIPE,
+                                   bufsize=blocksize)
+        return InputFile(process.stdout, raw, size, compressed=True, process=process)
+    # zlib, bz2 and lzma release the GIL while they decompress, so a thread runs alongside
+    return InputFile(ThreadedReader(decompress(raw), blocksize, queue_size), raw, size,
+                     compressed=True)
+
+
+class ThreadedReader:
+    """Reads a stream in a background thread, keeping at most queue_size blocks ahead"""
+
+    def __init__(self, stream, blocksize=1 << 20, queue_size=16):
+        self.stream = stream
+        self.blocksize = blocksize
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop = threading.Event()
+        self.block = b''
+        self.position = 0
+        self.eof = False
+        self.thread = threading.Thread(target=self._fill, daemon=True)
+        self.thread.start()
+
+    def _fill(self):
+        try:
+            while not self.stop.is_set():
+                block = self.stream.read(self.blocksize)
+                self._put(block)
+                if not block:
+                    return
+        except Exception as exception:
+            # Raised in the reading thread instead
+            self._put(exception)
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def read(self, size=-1):
+        parts = []
+        wanted = size
+        while wanted != 0:
+            if self.position == len(self.block):
+                if self.eof:
+                    break
+                item = self.queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                if not item:
+                    self.eof = True
+                    break
+                self.block, self.position = item, 0
+            end = len(self.block) if wanted < 0 else min(len(self.block), self.position + wanted)
+            parts.append(self.block[self.position:end])
+            if wanted > 0:
+                wanted -= end - self.position
+            self.position = end
+        return b''.join(parts)
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.stream.close()
+
+
+class InputFile:
+    """The bytes of the (decompressed) input, read front to back. size and position() are
+    those of the file on disk, for the progress; size is None for stdin."""
+
+    def __init__(self, stream, raw, size, compressed, process=None):
+        self.stream = stream
+        self.raw = raw
+        self.size = size
+        self.compressed = compressed
+        self.process = process
+        self.offset = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.offset += len(data)
+        if not data and self.process and self.process.wait() != 0:
+            raise OSError("{program} exited with {code}".format(
+                program=self.process.args[0], code=self.process.returncode))
+        return data
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset):
+        """Go to this offset in the decompressed bytes. Only uncompressed files can go back,
+        otherwise everything up to the offset is read and skipped."""
+        if not self.compressed and self.raw is not sys.stdin.buffer:
+            self.stream.seek(offset)
+            self.offset = offset
+            return
+        if offset < self.offset:
+            raise ValueError("Can't go back in a compressed input or stdin")
+        while self.offset < offset:
+            if not self.read(min(offset - self.offset, 1 << 20)):
+                break
+
+    def position(self):
+        """Bytes of the file on disk that have been read so far"""
+        if self.raw is sys.stdin.buffer:
+            return None
+        # The decompression process shares the file offset of raw
+        return os.lseek(self.raw.fileno(), 0, os.SEEK_CUR)
+
+    def close(self):
+        if self.process:
+            self.stream.close()
+            if self.process.poll() is None:
+                self.process.terminate()
+            self.process.wait()
+        elif self.stream is not self.raw:
+            self.stream.close()
+        if self.raw is not sys.stdin.buffer:
+            self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_plain(filename):
+    """True if filename is an uncompressed file, which can be read from any offset"""
+    if filename == '-':
+        return False
+    with open(filename, 'rb') as file:
+        return compression_of(file.read(8)) is None
@@ -0,0 +1,82 @@
+# Instrumentation of a load: wall time, rows, bytes of parameters and server counters per
+# stage (parsing, extracting each section, writing each section), reported as JSON at the
+# end of a run, and an optional periodic progress line with rate and ETA.
+
+import json
+import time
+from collections import Counter
+
+
+def param_bytes(params):
+    """Approximate number of bytes of query parameters sent to the server"""
+    return len(json.dumps(params, default=str).encode('utf-8'))
+
+
+class Metrics:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def record(self, stage, seconds, rows=0, nbytes=0, counters=None):
+        """Add one call of a stage. counters is a dict of server counters, if any"""
+        totals = self.stages.get(stage)
+        if totals is None:
+            totals = self.stages[stage] = {'calls': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0,
+                                           'counters': Counter()}
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['rows'] += rows
+        totals['bytes'] += nbytes
+        if counters:
+            totals['counters'].update(counters)
+
+    def add_counters(self, stage, counters):
+        """Add server counters to a stage, without counting it as a call"""
+        self.record(stage, 0.0, counters=counters)
+        self.stages[stage]['calls'] -= 1
+
+    def report(self):
+        """The totals of every stage, as a dict that can be written as JSON"""
+        stages = {}
+        for stage, totals in self.stages.items():
+            stages[stage] = dict(totals, counters=dict(totals['counters']))
+            stages[stage]['rows_per_second'] = (totals['rows'] / totals['seconds']
+                                                if totals['seconds'] else None)
+        return {'seconds': time.perf_counter() - self.start, 'stages': stages}
+
+    def write_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+
+class Progress:
+    """Prints a progress line every interval seconds while entries are passed through track().
+    With total and position (a function returning how far we are, e.g. the offset in the
+    file) the line also has the ETA."""
+
+    def __init__(self, interval=10.0, total=None, position=None):
+        self.interval = interval
+        self.total = total
+        self.position = position
+        self.start = self.last = time.perf_counter()
+
+    def track(self, entries):
+        done = 0
+        for entry in entries:
+            yield entry
+            done += 1
+            now = time.perf_counter()
+            if now - self.last >= self.interval:
+                self.last = now
+                print(self.line(done, now - self.start))
+
+    def line(self, done, seconds):
+        line = "{n} entries in {s:.0f}s, {rate:.1f} entries/s".format(
+            n=done, s=seconds, rate=done / seconds)
+        if self.total and self.position:
+            fraction = self.position() / self.total
+            if fraction > 0:
+                line += ", {p:.1f}%, ETA {eta:.0f}s".format(
+                    p=100 * fraction, eta=seconds / fraction - seconds)
+        return line
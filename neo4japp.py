@@ -7,39 +7,561 @@ Created on Mon Mar 27 14:52:20 2023
 
 from neo4j import GraphDatabase
 import logging
-from neo4j.exceptions import ServiceUnavailable
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from neo4j.exceptions import Neo4jError, ServiceUnavailable, SessionExpired, TransientError
+from metrics import param_bytes
+from sequencestore import decompress, is_shared
+
+# Constraints and indexes the queries below rely on, as (name, label, properties, unique).
+# Without them every MERGE/MATCH on these properties is a scan over all nodes of the label.
+# Every label that is MERGEd on is unique: two transactions that MERGE the same new node at
+# the same time (as the writers of AsyncApp do) would otherwise both create it.
+SCHEMA = [
+    ('protein_id', 'Protein', ['id'], True),
+    ('gene_name', 'Gene', ['name'], True),
+    ('author_name', 'Author', ['name'], True),
+    ('keyword_keyword_id', 'Keyword', ['keyword', 'id'], True),
+    ('organism_name_taxonomy_id', 'Organism', ['name', 'taxonomy_id'], True),
+    ('feature_name_type_evidence', 'Feature', ['name', 'type', 'evidence'], True),
+    ('name_name_type', 'Name', ['name', 'type'], True),
+    ('reference_key', 'Reference', ['key'], False),
+    ('evidence_id', 'Evidence', ['id'], True),
+    ('sequence_checksum', 'Sequence', ['checksum'], False),
+    # Proteins have a Sequence of their own by default, with checksums that repeat, so the
+    # shared ones of sequencestore have a label of their own to be unique on
+    ('shared_sequence_checksum', 'SharedSequence', ['checksum'], True),
+]
+
+# Queries used to write a batch of entries, one per section. Every query gets a list
+# $entries of {protein_id, rows}, where rows is the section's data for that protein,
+# so a single UNWIND writes the section for the whole batch.
+# The order matters: proteins first, then the nodes others link to: references before their
+# authors and evidence, evidence before the names and features that link to it.
+BATCH_QUERIES = [
+    ('protein', None,
+     """UNWIND $entries AS e
+     MERGE (pr:Protein {id: e.protein_id})"""),
+    ('gene', 'gene_list',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     UNWIND e.rows AS gl
+     MERGE (g:Gene { name: gl.name })
+     CREATE (pr)-[:FROM_GENE {status: gl.type}]->(g)"""),
+    ('organism', 'organism_dict',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     UNWIND e.rows AS ol
+     MERGE (o:Organism { name: ol.scientificName, taxonomy_id: ol.id})
+     CREATE (pr) -[:IN_ORGANISM]-> (o)"""),
+    ('references', 'reference_list',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     CALL apoc.create.nodes(['Reference'], e.rows) YIELD node
+     CREATE (pr) -[:HAS_REFERENCE]-> (node)"""),
+    # Reference keys are only unique within an entry, so go through the protein
+    ('authors', 'author_list',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     UNWIND e.rows AS al
+     MATCH (pr) -[:HAS_REFERENCE]-> (r:Reference {key: al.ref_key})
+     MERGE (a:Author { name: al.name})
+     CREATE (r) -[:HAS_AUTHOR]-> (a)"""),
+    ('dbreferences', 'dbref_list',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     CALL apoc.create.nodes(['dbReference'], e.rows) YIELD node
+     CREATE (pr)-[:HAS_DBREFERENCE]->(node)"""),
+    ('keywords', 'keyword_list',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     UNWIND e.rows AS kl
+     MERGE (k:Keyword { keyword: kl.keyword, id: kl.id})
+     CREATE (pr) -[:HAS_KEYWORD]-> (k)"""),
+    # Evidence keys are only unique within an entry, so the id of an evidence has the protein_id.
+    # The protein links to all of it, also to the evidence of parts of the entry that aren't
+    # in the graph, like comments
+    ('evidence', 'evidence_list',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     UNWIND e.rows AS el
+     MERGE (ev:Evidence {id: e.protein_id + ':' + el.key})
+     SET ev.type = el.type, ev.key = el.key, ev.source = el.sourcetype,
+         ev.source_id = el.sourceid
+     MERGE (pr) -[:HAS_EVIDENCE]-> (ev)"""),
+    # References belong to a single protein, so they link to their evidence themselves
+    ('evidence links', 'evidence_link_list',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     UNWIND e.rows AS l
+     MATCH (pr) -[:HAS_REFERENCE]-> (r:Reference {key: l.ref_key})
+     MATCH (ev:Evidence {id: e.protein_id + ':' + l.key})
+     MERGE (r) -[:HAS_EVIDENCE]-> (ev)"""),
+    # Run once for every relationship type, see group_names. Names and features are shared
+    # by proteins, so the ids of their evidence in this entry go on the relationship, and
+    # their links to the evidence have the protein_id
+    ('names', 'protein_name_list',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     UNWIND e.rows AS pnl
+     MERGE (n:Name { name: pnl.name, type: pnl.recalt })
+     CREATE (pr)-[:{rel_type} {evidence_ids: pnl.evidence_ids}]->(n)
+     CALL {
+         WITH e, n, pnl
+         UNWIND coalesce(pnl.evidence_ids, []) AS id
+         MATCH (ev:Evidence {id: id})
+         MERGE (n) -[:HAS_EVIDENCE {protein_id: e.protein_id}]-> (ev)
+     }"""),
+    ('features', 'feature_list',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     UNWIND e.rows AS fl
+     MERGE (f:Feature { name: fl.name, type: fl.type, evidence: fl.evidence})
+     CREATE (pr) -[:HAS_FEATURE {begin: fl.begin, end: fl.end, position: fl.position,
+                                 evidence_ids: fl.evidence_ids}]-> (f)
+     CALL {
+         WITH e, f, fl
+         UNWIND coalesce(fl.evidence_ids, []) AS id
+         MATCH (ev:Evidence {id: id})
+         MERGE (f) -[:HAS_EVIDENCE {protein_id: e.protein_id}]-> (ev)
+     }"""),
+    ('sequence', 'sequence_dict',
+     """UNWIND $entries AS e
+     MATCH (pr:Protein {id: e.protein_id})
+     CALL apoc.create.node(['Sequence'], e.rows) YIELD node
+     CREATE (pr) -[:HAS_SEQUENCE]-> (node)"""),
+]
+
+# Rows of the 'sequence' section made by sequencestore.shared_sequence are written with this
+# query instead: a single Sequence node per checksum, also labelled SharedSequence, the rest
+# of the attributes on the link
+SHARED_SEQUENCE_QUERY = (
+    """UNWIND $entries AS e
+    MATCH (pr:Protein {id: e.protein_id})
+    MERGE (s:Sequence:SharedSequence {checksum: e.rows.checksum})
+    ON CREATE SET s.length = e.rows.length, s.mass = e.rows.mass, s.residues = e.rows.residues
+    CREATE (pr) -[r:HAS_SEQUENCE]-> (s)
+    SET r = e.rows.link""")
+
+# Queries used by clear_db, as (what, query counting them, query deleting them, counter of
+# the deleted ones). The server commits every $batch_size rows, so they have to be run in an
+# auto-commit transaction.
+CLEAR_QUERIES = [
+    ('relationships',
+     "MATCH ()-[r]->() RETURN count(r) AS n",
+     "MATCH ()-[r]->() CALL { WITH r DELETE r } IN TRANSACTIONS OF $batch_size ROWS",
+     'relationships_deleted'),
+    ('nodes',
+     "MATCH (n) RETURN count(n) AS n",
+     "MATCH (n) CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF $batch_size ROWS",
+     'nodes_deleted'),
+]
+
+# Shared nodes that a nodecache.NodeCache remembers, by section: the label, and the properties
+# of a row that identify the node. Rows of nodes in the cache are written with the query in
+# CACHED_QUERIES, which has MATCH instead of MERGE (the only MERGE of these queries is the
+# one of the shared node).
+CACHED_SECTIONS = {
+    'gene': ('Gene', ('name',)),
+    'authors': ('Author', ('name',)),
+    'keywords': ('Keyword', ('keyword', 'id')),
+    'organism': ('Organism', ('scientificName', 'id')),
+}
+CACHED_QUERIES = {section: query.replace('MERGE', 'MATCH') for section, key, query in BATCH_QUERIES
+                  if section in CACHED_SECTIONS}
+
+
+def section_rows(rows):
+    """The rows of a section as a list, the organism is a single dict or None"""
+    if rows is None:
+        return []
+    return [rows] if isinstance(rows, dict) else rows
+
+
+def node_key(row, properties):
+    return tuple(row.get(name) for name in properties)
+
+
+# Queries that remove everything a protein links to before it is written again. References,
+# dbReferences and evidence only belong to this protein and are deleted, and so is its
+# sequence unless another protein shares it (see SHARED_SEQUENCE_QUERY); nodes shared with
+# other proteins (genes, names, keywords, features, ...) stay, only the links to them go.
+DELETE_QUERIES = [
+    """UNWIND $protein_ids AS id
+    MATCH (ev:Evidence) WHERE ev.id STARTS WITH id + ':'
+    DETACH DELETE ev""",
+    """UNWIND $protein_ids AS id
+    MATCH (pr:Protein {id: id}) -[:HAS_REFERENCE|HAS_DBREFERENCE]-> (n)
+    DETACH DELETE n""",
+    """UNWIND $protein_ids AS id
+    MATCH (pr:Protein {id: id}) -[r:HAS_SEQUENCE]-> (s)
+    DELETE r
+    WITH DISTINCT s
+    WHERE NOT (s) <-[:HAS_SEQUENCE]- ()
+    DELETE s""",
+    """UNWIND $protein_ids AS id
+    MATCH (pr:Protein {id: id}) -[r]-> ()
+    DELETE r""",
+]
+DELETE_PROTEIN_QUERY = (
+    """UNWIND $protein_ids AS id
+    MATCH (pr:Protein {id: id})
+    DETACH DELETE pr""")
+
+
+def group_names(protein_name_list):
+    """Group the protein names by their relationship type (HAS_FULL_NAME etc.), so each
+    group can be written with the type fixed in the query instead of with APOC"""
+    groups = {}
+    for pnl in protein_name_list:
+        if not re.fullmatch(r'[A-Z_]+', pnl['has']):
+            raise ValueError("Invalid relationship type {has}".format(has=pnl['has']))
+        groups.setdefault(pnl['has'], []).append(pnl)
+    return groups
+
+
+# Errors after which a batch is written again, see App.write_batch: the server is gone or
+# restarting, or the transaction failed for a reason that passes, like a deadlock
+RETRY_ERRORS = (ServiceUnavailable, SessionExpired, TransientError)
+
+
+def backoff_delays(retries, backoff=1.0, maximum=60.0):
+    """Seconds to wait before each of the retries, doubling every time up to maximum"""
+    return [min(backoff * 2 ** attempt, maximum) for attempt in range(retries)]
+
+
+# Server counters that are totaled per section in App.counters
+COUNTERS = ('nodes_created', 'relationships_created', 'properties_set', 'labels_added',
+            'nodes_deleted', 'relationships_deleted')
+
 
 class App:
 
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    def __init__(self, uri, user, password, quiet=False, driver=None, metrics=None,
+                 retries=0, backoff=1.0, cache=None, sequences=None):
+        # A driver can be passed in instead, like the fake one in benchmarks/fakedriver.py
+        self.driver = driver or GraphDatabase.driver(uri, auth=(user, password))
+        # In quiet mode the queries don't return anything and nothing is printed per row,
+        # only the server counters are totaled per section, see report()
+        self.quiet = quiet
+        self.counters = {}
+        # Optional metrics.Metrics, recording the time, rows and bytes of every write
+        self.metrics = metrics
+        # How often load() writes a batch again after an error in RETRY_ERRORS, and the
+        # seconds it waits before the first retry
+        self.retries = retries
+        self.backoff = backoff
+        # Optional nodecache.NodeCache of the shared nodes written so far, see CACHED_SECTIONS
+        self.cache = cache
+        # Optional sequencestore.SequenceStore, get_sequence reads the external residues from it
+        self.sequences = sequences
 
     def close(self):
         # Don't forget to close the driver connection when you are finished with it
         self.driver.close()
         
-    def clear_db(self):
+    def count(self, section, counters):
+        """Add the counters of a query result (result.consume().counters) to the section's totals"""
+        values = {name: getattr(counters, name) for name in COUNTERS}
+        self.counters.setdefault(section, Counter()).update(values)
+        if self.metrics:
+            self.metrics.add_counters('write ' + section, values)
+
+    def _execute_write(self, session, stage, work, *args):
+        """session.execute_write(work, *args), recorded as this stage if there are metrics.
+        The time includes sending the parameters and the commit."""
+        if self.metrics is None:
+            return session.execute_write(work, *args)
+        start = time.perf_counter()
+        result = session.execute_write(work, *args)
+        rows = sum(len(arg) for arg in args if isinstance(arg, list))
+        self.metrics.record(stage, time.perf_counter() - start,
+                            rows=rows, nbytes=param_bytes(
+                                [arg for arg in args if isinstance(arg, (list, dict, str))]))
+        return result
+
+    def report(self):
+        """Print the counters totaled per section and for the whole run, and return the totals"""
+        run = Counter()
+        for section, totals in self.counters.items():
+            run.update(totals)
+            print("{section:>14}: {totals}".format(section=section, totals=", ".join(
+                "{n} {name}".format(n=totals[name], name=name.replace('_', ' ')) for name in COUNTERS)))
+        print("{section:>14}: {totals}".format(section='total', totals=", ".join(
+            "{n} {name}".format(n=run[name], name=name.replace('_', ' ')) for name in COUNTERS)))
+        return run
+
+    def clear_db(self, batch_size=10000, interval=10):
+        """Delete everything, in transactions of at most batch_size relationships or nodes,
+        so a large graph doesn't have to be deleted in one transaction that exhausts the heap.
+        Relationships go first, so deleting a node never has to detach many at once.
+        Deleting again after a failure picks up where it stopped. Unless quiet, the progress
+        is printed every interval seconds while deleting."""
         with self.driver.session(database="neo4j") as session:
-            query = (
-                "MATCH (n) "
-                "DETACH DELETE n")
-            session.run(query)
-            print('db cleared')  
+            for what, count_query, query, counter in CLEAR_QUERIES:
+                total = session.run(count_query).single()["n"]
+                if total == 0:
+                    continue
+                done = threading.Event()
+                if not self.quiet:
+                    print("Deleting {t} {what}".format(t=total, what=what))
+                    reporter = threading.Thread(target=self._report_clear, daemon=True,
+                                                args=(count_query, total, what, done, interval))
+                    reporter.start()
+                try:
+                    summary = session.run(query, batch_size=batch_size).consume()
+                # Capture any errors along with the query for traceability
+                except ServiceUnavailable as exception:
+                    logging.error("{query} raised an error: \n {exception}".format(
+                        query=query, exception=exception))
+                    raise
+                finally:
+                    done.set()
+                if not self.quiet:
+                    reporter.join()
+                    print("Deleted {d} of {t} {what}".format(
+                        d=getattr(summary.counters, counter), t=total, what=what))
+            if not self.quiet:
+                print('db cleared')
+
+    def _report_clear(self, count_query, total, what, done, interval):
+        """Print how many of total have been deleted every interval seconds until done is set.
+        The inner transactions of clear_db commit as they go, so the count, which the server
+        keeps for every label and type anyway, goes down while it runs."""
+        with self.driver.session(database="neo4j") as session:
+            while not done.wait(interval):
+                left = session.run(count_query).single()["n"]
+                print("Deleted {d} of {t} {what}".format(d=total - left, t=total, what=what))
+
+    def ensure_schema(self):
+        """Create the constraints and indexes in SCHEMA if they don't exist yet, wait for
+        them to come online and report any that are still missing. Safe to run before every load."""
+        with self.driver.session(database="neo4j") as session:
+            # Databases set up when some of these were plain indexes still have those, under
+            # the same name, and a constraint can't be created next to an index on its properties
+            plain = {row["name"] for row in session.run(
+                "SHOW INDEXES YIELD name, owningConstraint "
+                "WHERE owningConstraint IS NULL RETURN name")}
+            for name, label, properties, unique in SCHEMA:
+                props = ", ".join("n." + prop for prop in properties)
+                if unique:
+                    if name in plain:
+                        session.run("DROP INDEX {name}".format(name=name)).consume()
+                    query = ("CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:{label}) "
+                             "REQUIRE ({props}) IS UNIQUE").format(
+                                 name=name, label=label, props=props)
+                else:
+                    query = "CREATE INDEX {name} IF NOT EXISTS FOR (n:{label}) ON ({props})".format(
+                        name=name, label=label, props=props)
+                try:
+                    session.run(query).consume()
+                # A constraint fails on duplicates that are already in the graph; those are
+                # reported by check_schema, the load itself can go on without it
+                except Neo4jError as exception:
+                    logging.error("{query} raised an error: \n {exception}".format(
+                        query=query, exception=exception))
+            session.run("CALL db.awaitIndexes(300)").consume()
+        return self.check_schema()
+
+    def check_schema(self):
+        """Report every (label, properties) in SCHEMA without an online index, as the
+        queries using those would have to scan all nodes with that label, and every unique
+        one without its uniqueness constraint. Returns them as (label, properties, unique)."""
+        with self.driver.session(database="neo4j") as session:
+            result = session.run(
+                "SHOW INDEXES YIELD labelsOrTypes, properties, state "
+                "WHERE state = 'ONLINE' RETURN labelsOrTypes, properties")
+            online = {(tuple(row["labelsOrTypes"] or []), tuple(row["properties"] or []))
+                      for row in result}
+            result = session.run(
+                "SHOW CONSTRAINTS YIELD labelsOrTypes, properties, type "
+                "WHERE type = 'UNIQUENESS' RETURN labelsOrTypes, properties")
+            constrained = {(tuple(row["labelsOrTypes"] or []), tuple(row["properties"] or []))
+                           for row in result}
+        missing = []
+        for name, label, properties, unique in SCHEMA:
+            key = ((label,), tuple(properties))
+            if key not in online:
+                missing.append((label, properties, False))
+                print("Missing index on {label}({props}), queries on it will scan all {label} nodes"
+                      .format(label=label, props=", ".join(properties)))
+            if unique and key not in constrained:
+                missing.append((label, properties, True))
+                print("Missing uniqueness constraint on {label}({props}), concurrent loads may "
+                      "create duplicate {label} nodes".format(label=label, props=", ".join(properties)))
+        return missing
+
+    def delete_proteins(self, protein_ids, batch_size=100, remove_protein=False):
+        """Remove the subgraph of these proteins (see DELETE_QUERIES), in transactions of
+        batch_size proteins. Shared nodes like genes, authors, keywords and organisms stay.
+        With remove_protein the protein nodes are deleted as well."""
+        protein_ids = list(protein_ids)
+        with self.driver.session(database="neo4j") as session:
+            for i in range(0, len(protein_ids), batch_size):
+                result = self._execute_write(
+                    session, 'delete proteins', self._delete_proteins, protein_ids[i:i + batch_size], remove_protein)
+                for counters in result:
+                    self.count('delete', counters)
+                if not self.quiet:
+                    print("Deleted the subgraph of {d} of {t} proteins".format(
+                        d=min(i + batch_size, len(protein_ids)), t=len(protein_ids)))
+
+    @staticmethod
+    def _delete_proteins(tx, protein_ids, remove_protein=False):
+        queries = DELETE_QUERIES + [DELETE_PROTEIN_QUERY] if remove_protein else DELETE_QUERIES
+        return [tx.run(query, protein_ids=protein_ids).consume().counters
+                for query in queries]
+
+    def load(self, entries, batch_size=500, replace=False, committed=None):
+        """Write extracted entries (e.g. from graphmaker.iter_entries) in batches of batch_size.
+        With replace, the existing subgraph of each protein is removed first.
+        committed is called with every batch once it has been committed."""
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                self.write_batch(batch, replace)
+                if committed:
+                    committed(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch, replace)
+            if committed:
+                committed(batch)
+
+    def write_batch(self, entries, replace=False):
+        """create_entries, but after an error in RETRY_ERRORS the batch is written again,
+        up to self.retries times with a growing delay, so a load survives a restart of the
+        server. A retry replaces the proteins, in case the failed attempt got committed."""
+        for delay in backoff_delays(self.retries, self.backoff):
+            try:
+                return self.create_entries(entries, replace)
+            except RETRY_ERRORS as exception:
+                logging.warning("Writing a batch of {n} entries failed, retrying in {d:g}s: "
+                                "{exception}".format(n=len(entries), d=delay, exception=exception))
+                time.sleep(delay)
+                replace = True
+        return self.create_entries(entries, replace)
+
+    def create_entries(self, entries, replace=False):
+        """Write a batch of extracted entries in a single transaction, with one query per section"""
+        with self.driver.session(database="neo4j") as session:
+            result = self._execute_write(session, 'transaction batch', self._create_entries,
+                                         entries, replace, self.metrics, self.cache)
+            self.remember(entries)
+            for section, counters in result:
+                self.count(section, counters)
+            if not self.quiet:
+                print("Loaded batch of {n} entries".format(n=len(entries)))
+
+    def remember(self, entries, sections=None):
+        """Add the shared nodes of committed entries to the cache, if there is one"""
+        if self.cache is None:
+            return
+        for section, key, query in BATCH_QUERIES:
+            if section in CACHED_SECTIONS and (sections is None or section in sections):
+                label, properties = CACHED_SECTIONS[section]
+                self.cache.add(label, [node_key(row, properties) for entry in entries
+                                       for row in section_rows(getattr(entry, key))])
+
+    @staticmethod
+    def _batch_statements(entries, sections=None, cache=None):
+        """The (section, query, entries) to run to write a batch, see BATCH_QUERIES.
+        sections limits it to those sections, the entries then only need their keys.
+        With a cache, the rows of shared nodes in it are written with a separate query
+        that MATCHes the node, see CACHED_SECTIONS."""
+        for section, key, query in BATCH_QUERIES:
+            if sections is not None and section not in sections:
+                continue
+            if section == 'names':
+                groups = {}
+                for entry in entries:
+                    for rel_type, rows in group_names(getattr(entry, key)).items():
+                        groups.setdefault(rel_type, []).append(
+                            {'protein_id': entry.protein_id, 'rows': rows})
+                for rel_type, params in groups.items():
+                    yield section, query.replace('{rel_type}', rel_type), params
+            elif section == 'sequence':
+                full, shared = [], []
+                for entry in entries:
+                    rows = getattr(entry, key)
+                    (shared if is_shared(rows) else full).append(
+                        {'protein_id': entry.protein_id, 'rows': rows})
+                if full:
+                    yield section, query, full
+                if shared:
+                    yield section, SHARED_SEQUENCE_QUERY, shared
+            elif cache is not None and section in CACHED_SECTIONS:
+                label, properties = CACHED_SECTIONS[section]
+                new, known = [], []
+                for entry in entries:
+                    new_rows, known_rows = [], []
+                    for row in section_rows(getattr(entry, key)):
+                        if (label, node_key(row, properties)) in cache:
+                            known_rows.append(row)
+                        else:
+                            new_rows.append(row)
+                    if new_rows:
+                        new.append({'protein_id': entry.protein_id, 'rows': new_rows})
+                    if known_rows:
+                        known.append({'protein_id': entry.protein_id, 'rows': known_rows})
+                if new:
+                    yield section, query, new
+                if known:
+                    yield section, CACHED_QUERIES[section], known
+            else:
+                yield section, query, [{'protein_id': entry.protein_id,
+                                        'rows': getattr(entry, key) if key else None}
+                                       for entry in entries]
+
+    @staticmethod
+    def _row_count(params):
+        """Number of rows in the parameters of a batch query, for the metrics"""
+        return sum(len(param['rows']) if isinstance(param['rows'], list) else 1
+                   for param in params)
+
+    @staticmethod
+    def _create_entries(tx, entries, replace=False, metrics=None, cache=None):
+        result = []
+        if replace:
+            result.extend(('delete', counters) for counters in App._delete_proteins(
+                tx, [entry.protein_id for entry in entries]))
+        for section, query, params in App._batch_statements(entries, cache=cache):
+            try:
+                start = time.perf_counter()
+                result.append((section, tx.run(query, entries=params).consume().counters))
+                if metrics:
+                    metrics.record('write ' + section, time.perf_counter() - start,
+                                   rows=App._row_count(params), nbytes=param_bytes(params))
+            # Capture any errors along with the query and data for traceability
+            except ServiceUnavailable as exception:
+                logging.error("{query} raised an error: \n {exception}".format(
+                    query=query, exception=exception))
+                raise
+        return result
 
     def create_protein(self, protein_id):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-                self._create_protein, protein_id)
+            result = self._execute_write(session, 'write protein',
+                self._create_protein, protein_id, self.quiet)
+            if self.quiet:
+                return self.count('protein', result)
             for row in result:
                 print("Created protein {pr}".format(pr=row['pr']))
                 
     @staticmethod
-    def _create_protein(tx, protein_id):
+    def _create_protein(tx, protein_id, quiet=False):
         query = (
-            """MERGE (pr:Protein {id: $protein_id})
-            RETURN pr""")
+            """MERGE (pr:Protein {id: $protein_id})""")
+        if not quiet:
+            query += " RETURN pr"
         result = tx.run(query, protein_id=protein_id)
         try:
+            if quiet:
+                return result.consume().counters
             return [{"pr": row["pr"]["id"]}
                     for row in result]
         except ServiceUnavailable as exception:
@@ -49,21 +571,26 @@ class App:
             
     def create_gene(self, protein_id, gene_list):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-            self._create_gene, protein_id, gene_list)
+            result = self._execute_write(session, 'write gene',
+            self._create_gene, protein_id, gene_list, self.quiet)
+            if self.quiet:
+                return self.count('gene', result)
             for row in result:
                 print("Linked gene {g} to protein {pr}".format(pr=row['pr'], g=row['g']))
     
     @staticmethod
-    def _create_gene(tx, protein_id, gene_list):
+    def _create_gene(tx, protein_id, gene_list, quiet=False):
         query = (
             """UNWIND $gene_list AS gl 
             MATCH (pr:Protein {id: $protein_id}) 
             MERGE (g:Gene { name: gl.name }) 
-            CREATE (pr)-[:FROM_GENE {status: gl.type}]->(g)
-            RETURN pr, g""")
+            CREATE (pr)-[:FROM_GENE {status: gl.type}]->(g)""")
+        if not quiet:
+            query += " RETURN pr, g"
         result = tx.run(query, gene_list=gene_list, protein_id=protein_id)
         try:
+            if quiet:
+                return result.consume().counters
             return [{"g": row["g"]["name"], "pr": row["pr"]["id"]}
                     for row in result]
         # Capture any errors along with the query and data for traceability
@@ -74,13 +601,52 @@ class App:
 
     def create_proteinnames(self, protein_id, protein_name_list):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-            self._create_proteinnames, protein_id, protein_name_list)
+            result = self._execute_write(session, 'write names',
+            self._create_proteinnames, protein_id, protein_name_list, self.quiet)
+            if self.quiet:
+                for counters in result:
+                    self.count('names', counters)
+                return
             for row in result:
                 print("Linked name {n} to protein {pr}".format(n=row['n'], pr=row['pr']))
     
+    # The relationship type can't be a parameter, so the names are grouped by type
+    # and every group gets its own query with the type written in it
+    @staticmethod
+    def _create_proteinnames(tx, protein_id, protein_name_list, quiet=False):
+        rows = []
+        for rel_type, group in group_names(protein_name_list).items():
+            query = (
+                """UNWIND $protein_name_list AS pnl 
+                MATCH (pr:Protein {id: $protein_id}) 
+                MERGE (n:Name { name: pnl.name, type: pnl.recalt }) 
+                CREATE (pr)-[:%s {evidence_ids: pnl.evidence_ids}]->(n)
+                CALL {
+                    WITH n, pnl
+                    UNWIND coalesce(pnl.evidence_ids, []) AS id
+                    MATCH (ev:Evidence {id: id})
+                    MERGE (n) -[:HAS_EVIDENCE {protein_id: $protein_id}]-> (ev)
+                }""" % rel_type)
+            if not quiet:
+                query += " RETURN n, pr"
+            result = tx.run(query, protein_name_list=group, protein_id=protein_id)
+            try:
+                if quiet:
+                    rows.append(result.consume().counters)
+                    continue
+                rows.extend({"n": row["n"]["name"], "pr": row["pr"]["id"]}
+                            for row in result)
+            # Capture any errors along with the query and data for traceability
+            except ServiceUnavailable as exception:
+                logging.error("{query} raised an error: \n {exception}".format(
+                    query=query, exception=exception))
+                raise
+        return rows
+
+    # Previous version, creating the relationships with APOC in a single query.
+    # Only kept for benchmarks/bench_names.py
     @staticmethod
-    def _create_proteinnames(tx, protein_id, protein_name_list):
+    def _create_proteinnames_apoc(tx, protein_id, protein_name_list):
         query = (
             """UNWIND $protein_name_list AS pnl 
             MATCH (pr:Protein {id: $protein_id}) 
@@ -100,8 +666,10 @@ class App:
                 
     def create_references(self, protein_id, reference_list):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-            self._create_references, protein_id, reference_list)
+            result = self._execute_write(session, 'write references',
+            self._create_references, protein_id, reference_list, self.quiet)
+            if self.quiet:
+                return self.count('references', result)
             for row in result:
                 print("Linked reference {r} to protein {pr}".format(r=row['r'], pr=row['pr']))
                 
@@ -110,14 +678,17 @@ class App:
     #                              first: rl.first, last: rl.last, DOI: rl.DOI,
     #                              PubMed: rl.PubMed})
     @staticmethod
-    def _create_references(tx, protein_id, reference_list):
+    def _create_references(tx, protein_id, reference_list, quiet=False):
         query = (
             """MATCH (pr:Protein {id: $protein_id}) 
             CALL apoc.create.nodes(['Reference'], $reference_list) YIELD node
-            CREATE (pr) -[:HAS_REFERENCE]-> (node) 
-            RETURN node, pr""")
+            CREATE (pr) -[:HAS_REFERENCE]-> (node) """)
+        if not quiet:
+            query += " RETURN node, pr"
         result = tx.run(query, reference_list=reference_list, protein_id=protein_id)
         try:
+            if quiet:
+                return result.consume().counters
             return [{"r": row["node"]["key"], "pr": row["pr"]["id"]}
                     for row in result]
         # Capture any errors along with the query and data for traceability
@@ -126,23 +697,30 @@ class App:
                 query=query, exception=exception))
             raise
     
-    def create_authors(self, author_list):
+    def create_authors(self, protein_id, author_list):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-            self._create_authors, author_list)
+            result = self._execute_write(session, 'write authors',
+            self._create_authors, protein_id, author_list, self.quiet)
+            if self.quiet:
+                return self.count('authors', result)
             for row in result:
                 print("Linked authors to reference {r}".format(r=row['r']))
     
     @staticmethod
-    def _create_authors(tx, author_list):
+    def _create_authors(tx, protein_id, author_list, quiet=False):
+        # Reference keys are only unique within an entry, so the reference is found
+        # through its protein
         query = (
             """UNWIND $author_list AS al 
-            MATCH (r:Reference {key: al.ref_key}) 
+            MATCH (:Protein {id: $protein_id}) -[:HAS_REFERENCE]-> (r:Reference {key: al.ref_key}) 
             MERGE (a:Author { name: al.name}) 
-            CREATE (r) -[:HAS_AUTHOR]-> (a) 
-            RETURN DISTINCT r""")
-        result = tx.run(query, author_list=author_list)
+            CREATE (r) -[:HAS_AUTHOR]-> (a) """)
+        if not quiet:
+            query += " RETURN DISTINCT r"
+        result = tx.run(query, protein_id=protein_id, author_list=author_list)
         try:
+            if quiet:
+                return result.consume().counters
             return [{"r": row["r"]["key"]}
                     for row in result]
         # Capture any errors along with the query and data for traceability
@@ -153,21 +731,26 @@ class App:
 
     def create_dbreferences(self, protein_id, dbref_list):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-            self._create_dbreferences, protein_id, dbref_list)
+            result = self._execute_write(session, 'write dbreferences',
+            self._create_dbreferences, protein_id, dbref_list, self.quiet)
+            if self.quiet:
+                return self.count('dbreferences', result)
             for row in result:
                 print("Linked dbReferences to protein {pr}".format(pr=row['pr']))
     
     @staticmethod
-    def _create_dbreferences(tx, protein_id, dbref_list):
+    def _create_dbreferences(tx, protein_id, dbref_list, quiet=False):
         query = (
             # UNWIND $dbref_list AS drl 
             """MATCH (pr:Protein {id: $protein_id}) 
             CALL apoc.create.nodes(['dbReference'], $dbref_list) YIELD node
-            CREATE (pr)-[:HAS_DBREFERENCE]->(node) 
-            RETURN DISTINCT pr""")
+            CREATE (pr)-[:HAS_DBREFERENCE]->(node) """)
+        if not quiet:
+            query += " RETURN DISTINCT pr"
         result = tx.run(query, dbref_list=dbref_list, protein_id=protein_id)
         try:
+            if quiet:
+                return result.consume().counters
             return [{"pr": row["pr"]["id"]}
                     for row in result]
         # Capture any errors along with the query and data for traceability
@@ -178,8 +761,10 @@ class App:
 
     def create_features(self, protein_id, feature_list):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-            self._create_features, protein_id, feature_list)
+            result = self._execute_write(session, 'write features',
+            self._create_features, protein_id, feature_list, self.quiet)
+            if self.quiet:
+                return self.count('features', result)
             for row in result:
                 print("Linked feature {f} to protein {pr}".format(f=row['f'], pr=row['pr']))
     
@@ -190,15 +775,25 @@ class App:
     # but you'll get duplicate nodes.
 
     @staticmethod
-    def _create_features(tx, protein_id, feature_list):
+    def _create_features(tx, protein_id, feature_list, quiet=False):
         query = (
             """UNWIND $feature_list AS fl
             MATCH (pr:Protein {id: $protein_id}) 
             MERGE (f:Feature { name: fl.name, type: fl.type, evidence: fl.evidence}) 
-            CREATE (pr) -[:HAS_FEATURE {begin: fl.begin, end: fl.end, position: fl.position}]-> (f) 
-            RETURN pr, f""")
+            CREATE (pr) -[:HAS_FEATURE {begin: fl.begin, end: fl.end, position: fl.position,
+                                        evidence_ids: fl.evidence_ids}]-> (f)
+            CALL {
+                WITH f, fl
+                UNWIND coalesce(fl.evidence_ids, []) AS id
+                MATCH (ev:Evidence {id: id})
+                MERGE (f) -[:HAS_EVIDENCE {protein_id: $protein_id}]-> (ev)
+            } """)
+        if not quiet:
+            query += " RETURN pr, f"
         result = tx.run(query, protein_id=protein_id, feature_list=feature_list)
         try:
+            if quiet:
+                return result.consume().counters
             return [{"pr": row["pr"]["id"], "f": row["f"]["name"]}
                     for row in result]
         # Capture any errors along with the query and data for traceability
@@ -207,49 +802,55 @@ class App:
                 query=query, exception=exception))
             raise
             
-    def create_evidence(self, evidence_list):
+    def create_evidence(self, protein_id, evidence_list, evidence_link_list):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-            self._create_evidence, evidence_list)
-            for row in result:
-                print("Linked evidence {e} to feature {f}".format(e=row['e'], f=row['f']))
+            result = self._execute_write(session, 'write evidence',
+            self._create_evidence, protein_id, evidence_list, evidence_link_list)
+            if self.quiet:
+                for section, counters in result:
+                    self.count(section, counters)
+                return
+            for link in evidence_link_list:
+                print("Linked evidence {e} to reference {r}".format(e=link['key'], r=link['ref_key']))
 
     @staticmethod
-    def _create_evidence(tx, evidence_list):
-        query = (
-            """UNWIND $evidence_list AS el 
-            MATCH (f:Feature {evidence: el.key}) 
-            MERGE (e:Evidence { type: el.type, key: el.key, source: el.sourcetype, 
-                               source_id: el.sourceid}) 
-            CREATE (f) -[:HAS_EVIDENCE]-> (e) 
-            RETURN f, e""")
-        result = tx.run(query, evidence_list=evidence_list)
-        try:
-            return [{"e": row["e"]["key"], "f": row["f"]["name"]}
-                    for row in result]
-        # Capture any errors along with the query and data for traceability
-        except ServiceUnavailable as exception:
-            logging.error("{query} raised an error: \n {exception}".format(
-                query=query, exception=exception))
-            raise        
+    def _create_evidence(tx, protein_id, evidence_list, evidence_link_list):
+        # The same queries as for a batch, with the links resolved by graphmaker
+        entry = SimpleNamespace(protein_id=protein_id, evidence_list=evidence_list,
+                                evidence_link_list=evidence_link_list)
+        result = []
+        for section, query, params in App._batch_statements([entry], ['evidence', 'evidence links']):
+            try:
+                result.append((section, tx.run(query, entries=params).consume().counters))
+            # Capture any errors along with the query and data for traceability
+            except ServiceUnavailable as exception:
+                logging.error("{query} raised an error: \n {exception}".format(
+                    query=query, exception=exception))
+                raise
+        return result
 
     def create_keywords(self, protein_id, keyword_list):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-            self._create_keywords, protein_id, keyword_list)
+            result = self._execute_write(session, 'write keywords',
+            self._create_keywords, protein_id, keyword_list, self.quiet)
+            if self.quiet:
+                return self.count('keywords', result)
             for row in result:
                 print("Linked keyword {k} to protein {pr}".format(k=row['k'], pr=row['pr']))
     
     @staticmethod
-    def _create_keywords(tx, protein_id, keyword_list):
+    def _create_keywords(tx, protein_id, keyword_list, quiet=False):
         query = (
             """UNWIND $keyword_list AS kl 
             MATCH (pr:Protein {id: $protein_id}) 
             MERGE (k:Keyword { keyword: kl.keyword, id: kl.id}) 
-            CREATE (pr) -[:HAS_KEYWORD]-> (k) 
-            RETURN pr, k""")
+            CREATE (pr) -[:HAS_KEYWORD]-> (k) """)
+        if not quiet:
+            query += " RETURN pr, k"
         result = tx.run(query, protein_id=protein_id, keyword_list=keyword_list)
         try:
+            if quiet:
+                return result.consume().counters
             return [{"pr": row["pr"]["id"], "k": row["k"]["keyword"]}
                     for row in result]
         # Capture any errors along with the query and data for traceability
@@ -260,20 +861,34 @@ class App:
 
     def create_sequence(self, protein_id, sequence_dict):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-            self._create_sequence, protein_id, sequence_dict)
+            result = self._execute_write(session, 'write sequence',
+            self._create_sequence, protein_id, sequence_dict, self.quiet)
+            if self.quiet:
+                return self.count('sequence', result)
             for row in result:
                 print("Linked sequence to protein {pr}".format(pr=row['pr']))
     
     @staticmethod
-    def _create_sequence(tx, protein_id, sequence_dict):
-        query = (
-            """MATCH (pr:Protein {id: $protein_id}) 
-            CALL apoc.create.node(['Sequence'], $sequence_dict) YIELD node
-            CREATE (pr) -[:HAS_SEQUENCE]-> (node) 
-            RETURN pr""")
+    def _create_sequence(tx, protein_id, sequence_dict, quiet=False):
+        if is_shared(sequence_dict):
+            query = (
+                """MATCH (pr:Protein {id: $protein_id})
+                MERGE (node:Sequence:SharedSequence {checksum: $sequence_dict.checksum})
+                ON CREATE SET node.length = $sequence_dict.length, node.mass = $sequence_dict.mass,
+                    node.residues = $sequence_dict.residues
+                CREATE (pr) -[r:HAS_SEQUENCE]-> (node)
+                SET r = $sequence_dict.link """)
+        else:
+            query = (
+                """MATCH (pr:Protein {id: $protein_id}) 
+                CALL apoc.create.node(['Sequence'], $sequence_dict) YIELD node
+                CREATE (pr) -[:HAS_SEQUENCE]-> (node) """)
+        if not quiet:
+            query += " RETURN pr"
         result = tx.run(query, protein_id=protein_id, sequence_dict=sequence_dict)
         try:
+            if quiet:
+                return result.consume().counters
             return [{"pr": row["pr"]["id"]}
                     for row in result]
         # Capture any errors along with the query and data for traceability
@@ -281,24 +896,59 @@ class App:
             logging.error("{query} raised an error: \n {exception}".format(
                 query=query, exception=exception))
             raise
-            
+
+    def get_sequence(self, protein_id):
+        """The amino acid string of a protein, or None if it has no sequence, however it is
+        stored (see sequencestore). Residues stored outside the graph need self.sequences."""
+        with self.driver.session(database="neo4j") as session:
+            row = session.execute_read(self._get_sequence, protein_id)
+        if row is None:
+            return None
+        if row['sequence'] is not None:
+            return row['sequence']
+        if row['residues'] is not None:
+            return decompress(bytes(row['residues']))
+        if self.sequences is None:
+            raise ValueError("The sequence of {pr} is stored outside the graph, App needs the "
+                             "SequenceStore".format(pr=protein_id))
+        return self.sequences.residues(row['checksum'])
+
+    @staticmethod
+    def _get_sequence(tx, protein_id):
+        query = (
+            """MATCH (:Protein {id: $protein_id}) -[:HAS_SEQUENCE]-> (s:Sequence)
+            RETURN s.sequence AS sequence, s.residues AS residues, s.checksum AS checksum""")
+        result = tx.run(query, protein_id=protein_id)
+        try:
+            return result.single()
+        # Capture any errors along with the query and data for traceability
+        except ServiceUnavailable as exception:
+            logging.error("{query} raised an error: \n {exception}".format(
+                query=query, exception=exception))
+            raise
+
     def create_organism(self, protein_id, organism_dict):
         with self.driver.session(database="neo4j") as session:
-            result = session.execute_write(
-            self._create_organism, protein_id, organism_dict)
+            result = self._execute_write(session, 'write organism',
+            self._create_organism, protein_id, organism_dict, self.quiet)
+            if self.quiet:
+                return self.count('organism', result)
             for row in result:
                 print("Linked organism {o} to protein {pr}".format(o=row['o'],pr=row['pr']))
     
     @staticmethod
-    def _create_organism(tx, protein_id, organism_dict):
+    def _create_organism(tx, protein_id, organism_dict, quiet=False):
         query = (
             """UNWIND $organism_dict AS ol 
             MATCH (pr:Protein {id: $protein_id}) 
             MERGE (o:Organism { name: ol.scientificName, taxonomy_id: ol.id}) 
-            CREATE (pr) -[:IN_ORGANISM]-> (o) 
-            RETURN pr, o""")
+            CREATE (pr) -[:IN_ORGANISM]-> (o) """)
+        if not quiet:
+            query += " RETURN pr, o"
         result = tx.run(query, protein_id=protein_id, organism_dict=organism_dict)
         try:
+            if quiet:
+                return result.consume().counters
             return [{"pr": row["pr"]["id"], "o": row["o"]["name"]}
                     for row in result]
         # Capture any errors along with the query and data for traceability
@@ -0,0 +1,48 @@
+# Client-side record of the shared nodes (genes, authors, keywords, organisms) that have
+# been committed during this run, so the writer can MATCH them instead of MERGE them again.
+# MATCH takes no locks and needs no uniqueness check, which matters for the few nodes that
+# almost every protein links to. Each label keeps at most maxsize keys, the least recently
+# used are forgotten first.
+
+from collections import Counter, OrderedDict
+
+
+class NodeCache:
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.keys = {}
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def __contains__(self, item):
+        """(label, key) in cache, counted as a hit or a miss of the label"""
+        label, key = item
+        keys = self.keys.get(label)
+        if keys is not None and key in keys:
+            keys.move_to_end(key)
+            self.hits[label] += 1
+            return True
+        self.misses[label] += 1
+        return False
+
+    def add(self, label, keys):
+        """Remember these keys of a label. Call this only once the nodes have been committed,
+        a rolled back MERGE would leave keys of nodes that don't exist"""
+        cached = self.keys.setdefault(label, OrderedDict())
+        for key in keys:
+            cached[key] = None
+            cached.move_to_end(key)
+        while len(cached) > self.maxsize:
+            cached.popitem(last=False)
+
+    def report(self, metrics=None):
+        """Print the hits and misses per label, and add them to the metrics as stage
+        'node cache <label>' if there are metrics"""
+        for label in sorted(set(self.hits) | set(self.misses)):
+            hits, misses = self.hits[label], self.misses[label]
+            print("{label:>14}: {h} hits, {m} misses, {p:.1f}% hits, {n} cached".format(
+                label=label, h=hits, m=misses, p=100 * hits / (hits + misses),
+                n=len(self.keys.get(label, ()))))
+            if metrics:
+                metrics.add_counters('node cache ' + label, {'hits': hits, 'misses': misses})
@@ -0,0 +1,117 @@
+# Compact storage of the protein sequences. By default every protein gets a Sequence node
+# of its own, with all attributes of its <sequence> and the amino acid string ('full').
+# The residues make up most of the size of the graph, while queries hardly ever read them,
+# so in the other modes there is a single Sequence node per checksum, shared by all
+# proteins with that sequence, that only keeps the checksum, length and mass, and is also
+# labelled SharedSequence:
+#
+#   'compressed'  the residues are stored on the node as well, compressed with zlib
+#   'external'    the residues are stored outside the graph, compressed in a local sqlite
+#                 file keyed by the checksum
+#
+# The attributes of <sequence> that belong to the entry (version, modified, fragment, ...)
+# go on its HAS_SEQUENCE relationship instead. App.get_sequence reads the residues back in
+# every mode. The checksum is the CRC64 UniProt gives every sequence; two different
+# sequences with the same CRC64 are very rare, and would be stored as one.
+
+import sqlite3
+import threading
+import zlib
+
+SEQUENCE_MODES = ('full', 'compressed', 'external')
+
+# The attributes of <sequence> that describe the sequence itself, and so the shared node
+NODE_ATTRIBUTES = ('checksum', 'length', 'mass')
+
+
+def compress(sequence):
+    return zlib.compress(sequence.encode('ascii'), 9)
+
+
+def decompress(residues):
+    return zlib.decompress(residues).decode('ascii')
+
+
+def shared_sequence(sequence_dict, residues=False):
+    """The row of the shared Sequence node for a sequence_dict of graphmaker: the checksum,
+    length and mass, the compressed residues if residues, and in link the other attributes,
+    for the HAS_SEQUENCE relationship"""
+    row = {'checksum': sequence_dict['checksum'], 'length': int(sequence_dict['length']),
+           'mass': int(sequence_dict['mass'])}
+    if residues:
+        row['residues'] = compress(sequence_dict['sequence'])
+    row['link'] = {name: value for name, value in sequence_dict.items()
+                   if name not in NODE_ATTRIBUTES and name != 'sequence'}
+    return row
+
+
+def is_shared(sequence_dict):
+    """True for a row made by shared_sequence, False for the attributes of a full Sequence node"""
+    return sequence_dict is not None and 'sequence' not in sequence_dict
+
+
+class SequenceStore:
+
+    def __init__(self, mode='full', path=None):
+        if mode not in SEQUENCE_MODES:
+            raise ValueError("Unknown sequence mode {mode}".format(mode=mode))
+        if mode == 'external' and path is None:
+            raise ValueError("The external sequence mode needs the path of the sqlite file")
+        self.mode = mode
+        self.path = path
+        self.connection = None
+        # Sequences that were new to the external file
+        self.stored = 0
+        if mode == 'external':
+            # The async loader compacts entries in its parsing thread and commits in the
+            # event loop, so the connection is shared between threads, like in StateStore
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.lock = threading.Lock()
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS sequences (
+                       checksum TEXT PRIMARY KEY,
+                       residues BLOB
+                   ) WITHOUT ROWID""")
+
+    def close(self):
+        if self.connection:
+            with self.lock:
+                self.connection.commit()
+                self.connection.close()
+
+    def compact(self, entries):
+        """Pass the entries through with their sequence_dict replaced by the row of the shared
+        Sequence node, see shared_sequence. In the external mode the residues are added to the
+        file, which is only committed by committed(). Entries are passed as they are in the
+        full mode."""
+        if self.mode == 'full':
+            yield from entries
+            return
+        for entry in entries:
+            if entry.sequence_dict is None:
+                yield entry
+                continue
+            row = shared_sequence(entry.sequence_dict, residues=self.mode == 'compressed')
+            if self.connection:
+                with self.lock:
+                    self.stored += self.connection.execute(
+                        "INSERT OR IGNORE INTO sequences (checksum, residues) VALUES (?, ?)",
+                        (row['checksum'], compress(entry.sequence_dict['sequence']))).rowcount
+            yield entry._replace(sequence_dict=row)
+
+    def committed(self, entries):
+        """Commit the residues of the external file. Call this with every batch once it has
+        been committed, before the checkpoint or state store record the batch as loaded, so
+        a Sequence node in the graph always has its residues in the file."""
+        if self.connection:
+            with self.lock:
+                self.connection.commit()
+
+    def residues(self, checksum):
+        """The amino acid string with this checksum from the external file, or None"""
+        if self.connection is None:
+            return None
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT residues FROM sequences WHERE checksum = ?", (checksum,)).fetchone()
+        return decompress(row[0]) if row else None
@@ -0,0 +1,47 @@
+# Local record of which version of every entry has been loaded, so an incremental load
+# of a new UniProt release only has to write the entries that changed since the last one.
+
+import sqlite3
+import threading
+
+
+class StateStore:
+
+    def __init__(self, path):
+        # The async loader checks entries in its parsing thread and marks them in the event
+        # loop, so the connection is shared between threads, one statement at a time
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS loaded (
+                   accession TEXT PRIMARY KEY,
+                   version TEXT,
+                   modified TEXT
+               ) WITHOUT ROWID""")
+        self.skipped = 0
+
+    def close(self):
+        self.connection.close()
+
+    def is_current(self, entry):
+        """True if this version of the entry has been loaded before"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT version, modified FROM loaded WHERE accession = ?",
+                (entry.protein_id,)).fetchone()
+        return row == (entry.version, entry.modified)
+
+    def changed(self, entries):
+        """Only yield the entries that are new or changed since they were last loaded"""
+        for entry in entries:
+            if self.is_current(entry):
+                self.skipped += 1
+            else:
+                yield entry
+
+    def mark_loaded(self, entries):
+        """Record the entries as loaded, call this only once they have been committed"""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO loaded (accession, version, modified) VALUES (?, ?, ?)",
+                [(entry.protein_id, entry.version, entry.modified) for entry in entries])
@@ -1,13 +1,21 @@
 # Short file to easily print content of the xml file and see which properties
 # are stored at which levels
+#
+#   python xmlprinter.py uniprot_sprot.xml.gz --entry 3 --items 15
+#   python xmlprinter.py uniprot_sprot.xml --accession Q9Y261
 
+import argparse
+import os
 import xml.etree.ElementTree as ET
+from accessionindex import AccessionIndex
+from entryscan import root_end, root_start
+from inputfile import open_input, is_plain
+
+# The example entry that comes with the code
+filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Q9Y261.xml')
+
+uniprot = '{http://uniprot.org/uniprot}'
 
-filename = r"C:\Users\danie\OneDrive\Documents\weavechallenge\Q9Y261.xml"
-tree = ET.parse(filename)
-root = tree.getroot()
-entry = root[0]
-uniprot = entry.tag.split('entry')[0]
 
 def explore_xml(branch,i):
     """Recursive function that will print tags, attributes and text from every branch"""
@@ -17,8 +25,64 @@ def explore_xml(branch,i):
         for child in branch:
             explore_xml(child,i)
 
-# Print the entry, here I specified to only print the first 15 items.
-# can also do for subclass in entry.findall(uniprot+'reference') for example, to print only references
-for subclass in entry[:15]:
-    explore_xml(subclass,0)
-    print("-"*50)
\ No newline at end of file
+
+def nth_entry(source, n=0):
+    """The n-th <entry> of the file (counting from 0), read up to that entry only"""
+    with open_input(source) as file:
+        for event, elem in ET.iterparse(file, events=('end',)):
+            if elem.tag == uniprot + 'entry':
+                if n == 0:
+                    return elem
+                n -= 1
+                elem.clear()
+    raise IndexError("The file has fewer entries")
+
+
+def entry_at(source, offset, length):
+    """The <entry> at this offset of an uncompressed file, e.g. from AccessionIndex.lookup"""
+    with open(source, 'rb') as file:
+        file.seek(offset)
+        data = file.read(length)
+    # The entry needs the namespace of the root element it was in
+    return ET.fromstring(root_start + data + root_end)[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the tags, attributes and text of an entry")
+    parser.add_argument('filename', nargs='?', default=filename,
+                        help="UniProt xml file, may be compressed with gzip, bzip2 or xz, or - for stdin")
+    parser.add_argument('--entry', type=int, default=0, help="which entry to print, 0 is the first")
+    parser.add_argument('--accession', help="print the entry with this accession instead, found "
+                                            "with the --index")
+    parser.add_argument('--index', metavar='INDEX_DB',
+                        help="accession index of the file (see accessionindex.py), built first if "
+                             "it doesn't exist, by default the filename with .idx")
+    parser.add_argument('--items', type=int, default=15,
+                        help="number of items of the entry to print")
+    args = parser.parse_args()
+
+    if args.accession:
+        if not is_plain(args.filename):
+            parser.error("--accession needs an uncompressed file, which can be read from any offset")
+        index_path = args.index or args.filename + '.idx'
+        new_index = not os.path.exists(index_path)
+        index = AccessionIndex(index_path)
+        if new_index:
+            print("Indexed {n} entries in {path}".format(n=index.build(args.filename), path=index_path))
+        try:
+            index.check(args.filename)
+        except ValueError as error:
+            parser.error(str(error))
+        ranges, missing = index.lookup([args.accession])
+        index.close()
+        if missing:
+            parser.error("{a} is not in the file".format(a=args.accession))
+        entry = entry_at(args.filename, *ranges[0])
+    else:
+        entry = nth_entry(args.filename, args.entry)
+
+    # Print the entry, here I specified to only print the first 15 items.
+    # can also do for subclass in entry.findall(uniprot+'reference') for example, to print only references
+    for subclass in entry[:args.items]:
+        explore_xml(subclass,0)
+        print("-"*50)